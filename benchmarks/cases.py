@@ -0,0 +1,177 @@
+"""The schemas and data the benchmarks marshal.
+
+Every case is a function returning ``(rows, schema, run)``: ``run(fields)``
+marshals the case's data once with ``fields``, either ``schema`` itself or
+its compiled plan, and ``rows`` is the number of objects it marshals.
+"""
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from flask_restful import fields, marshal
+
+ROWS = 1000
+
+CASES = []
+
+
+def case(func):
+    CASES.append((func.__name__, func))
+    return func
+
+
+class Todo(object):
+    """An ORM like object, with more attributes than it renders"""
+
+    def __init__(self, idx):
+        self.id = idx
+        self.title = 'Todo %d' % idx
+        self.description = 'Something to do, number %d' % idx
+        self.priority = idx % 5
+        self.score = idx / 7.0
+        self.done = idx % 2 == 0
+        self.created = datetime(2020, 1, 1) + timedelta(minutes=idx)
+        self.updated = datetime(2020, 6, 1) + timedelta(seconds=idx)
+        self.owner = Owner(idx % 50)
+        self.tags = ['tag%d' % (idx % 10), 'tag%d' % (idx % 7)]
+        self._session = object()
+        self._state = {'dirty': False}
+
+
+class Owner(object):
+
+    def __init__(self, idx):
+        self.id = idx
+        self.name = 'User %d' % idx
+        self.email = 'user%d@example.com' % idx
+        self.address = {'city': 'Paris', 'zip': '750%02d' % (idx % 20)}
+
+
+owner_fields = {
+    'id': fields.Integer,
+    'name': fields.String,
+    'email': fields.String,
+}
+
+todo_fields = {
+    'id': fields.Integer,
+    'title': fields.String,
+    'description': fields.String,
+    'priority': fields.Integer,
+    'score': fields.Float,
+    'done': fields.Boolean,
+    'tags': fields.List(fields.String),
+}
+
+
+def _run(data, envelope=None):
+    return lambda schema: marshal(data, schema, envelope=envelope)
+
+
+@case
+def flat_dicts():
+    data = [dict((key, getattr(Todo(idx), key)) for key in todo_fields)
+            for idx in range(ROWS)]
+    return ROWS, todo_fields, _run(data)
+
+
+@case
+def orm_objects():
+    return ROWS, todo_fields, _run([Todo(idx) for idx in range(ROWS)])
+
+
+@case
+def dotted_attributes():
+    schema = {
+        'id': fields.Integer,
+        'owner_name': fields.String(attribute='owner.name'),
+        'owner_email': fields.String(attribute='owner.email'),
+        'city': fields.String(attribute='owner.address.city'),
+        'zip': fields.String(attribute='owner.address.zip'),
+    }
+    return ROWS, schema, _run([Todo(idx) for idx in range(ROWS)])
+
+
+@case
+def deep_nested():
+    depth = 6
+    schema = {'id': fields.Integer, 'name': fields.String}
+    for _ in range(depth):
+        schema = {'id': fields.Integer, 'name': fields.String,
+                  'child': fields.Nested(schema)}
+
+    def build(idx, level):
+        obj = {'id': idx, 'name': 'level %d' % level}
+        if level:
+            obj['child'] = build(idx, level - 1)
+        return obj
+
+    rows = ROWS // depth
+    return rows, schema, _run([build(idx, depth) for idx in range(rows)])
+
+
+@case
+def list_of_nested():
+    schema = {
+        'id': fields.Integer,
+        'todos': fields.List(fields.Nested(dict(
+            todo_fields, owner=fields.Nested(owner_fields)))),
+    }
+    data = {'id': 1, 'todos': [Todo(idx) for idx in range(ROWS)]}
+    return ROWS, schema, _run(data)
+
+
+@case
+def tuple_rows():
+    columns = ('id', 'title', 'description', 'priority', 'score', 'done')
+    schema = dict((key, todo_fields[key]) for key in columns)
+    data = [tuple(getattr(Todo(idx), key) for key in columns)
+            for idx in range(ROWS)]
+    return ROWS, schema, lambda schema: marshal(data, schema, columns=columns)
+
+
+@case
+def long_lists():
+    schema = {
+        'id': fields.Integer,
+        'tag_ids': fields.List(fields.Integer),
+        'tags': fields.List(fields.String),
+    }
+    data = [{'id': idx, 'tag_ids': list(range(ROWS)),
+             'tags': ['tag%d' % i for i in range(ROWS)]} for idx in range(10)]
+    return 10 * ROWS, schema, _run(data)
+
+
+@case
+def url_rows():
+    app = Flask(__name__)
+    app.add_url_rule('/todos/<int:id>', 'todo', lambda id: '')
+    app.add_url_rule('/users/<int:id>', 'user', lambda id: '')
+    schema = {
+        'id': fields.Integer,
+        'uri': fields.Url('todo'),
+        'absolute_uri': fields.Url('todo', absolute=True),
+        'user_uri': fields.Url('user'),
+    }
+    data = [{'id': idx} for idx in range(ROWS)]
+
+    def run(schema):
+        with app.test_request_context('/'):
+            return marshal(data, schema)
+    return ROWS, schema, run
+
+
+@case
+def datetime_rows():
+    schema = {
+        'id': fields.Integer,
+        'created': fields.DateTime(dt_format='rfc822'),
+        'updated': fields.DateTime(dt_format='iso8601'),
+    }
+    return ROWS, schema, _run([Todo(idx) for idx in range(ROWS)])
+
+
+@case
+def enveloped():
+    return ROWS, todo_fields, _run([Todo(idx) for idx in range(ROWS)],
+                                   envelope='data')
@@ -0,0 +1,147 @@
+"""Measure how fast :func:`flask_restful.marshal` marshals the cases of
+``benchmarks/cases.py``, with the schema dicts and with compiled schemas.
+
+Usage::
+
+    python benchmarks/run.py                        # print a table
+    python benchmarks/run.py --json results.json    # also save the results
+    python benchmarks/run.py --compare results.json # compare to saved ones
+
+With ``--compare``, the exit status is 1 when a case got slower than
+``--max-regression`` percent, if given.
+"""
+from __future__ import print_function
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:
+    # python 2
+    tracemalloc = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_restful import fields  # noqa: E402
+from flask_restful.__version__ import __version__  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cases import CASES  # noqa: E402
+
+
+def variants(schema):
+    yield '', schema
+    yield '[compiled]', fields.compile(schema)
+
+
+def measure(run, schema, repeat, min_time):
+    # run the case often enough for every measure to last min_time
+    number = 1
+    while timeit.timeit(lambda: run(schema), number=number) < min_time:
+        number *= 2
+    times = timeit.repeat(lambda: run(schema), number=number, repeat=repeat)
+    per_call = [elapsed / number for elapsed in times]
+    return min(per_call), sum(per_call) / len(per_call)
+
+
+def peak_memory(run, schema):
+    if tracemalloc is None:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        run(schema)
+        return tracemalloc.get_traced_memory()[1] - start
+    finally:
+        tracemalloc.stop()
+
+
+def run_cases(selected, repeat, min_time):
+    results = []
+    for name, build in CASES:
+        if selected and not any(part in name for part in selected):
+            continue
+        rows, schema, run = build()
+        for suffix, variant in variants(schema):
+            best, mean = measure(run, variant, repeat, min_time)
+            result = {
+                'name': name + suffix,
+                'rows': rows,
+                'best': best,
+                'mean': mean,
+                'rows_per_sec': rows / best,
+                'peak_bytes': peak_memory(run, variant),
+            }
+            results.append(result)
+            print_result(result)
+    return results
+
+
+def print_result(result):
+    peak = result['peak_bytes']
+    print('{0:<32} {1:>12.0f} rows/s {2:>10.3f} ms {3:>10}'.format(
+        result['name'], result['rows_per_sec'], result['best'] * 1000,
+        '-' if peak is None else '%d KiB' % (peak // 1024)))
+
+
+def compare(results, baseline, max_regression):
+    """Print how much faster or slower each case got, return the names of the
+    ones that got slower than ``max_regression`` percent"""
+    previous = dict((result['name'], result) for result in baseline['results'])
+    regressions = []
+    print()
+    print('compared to %s' % baseline.get('description', 'the baseline'))
+    for result in results:
+        if result['name'] not in previous:
+            continue
+        change = (result['best'] / previous[result['name']]['best'] - 1) * 100
+        print('{0:<32} {1:>+8.1f}%'.format(result['name'], change))
+        if max_regression is not None and change > max_regression:
+            regressions.append(result['name'])
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('cases', nargs='*',
+                        help='only run the cases whose name contains one of these')
+    parser.add_argument('--json', metavar='FILE',
+                        help='write the results to FILE as JSON')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare the results to the ones saved in FILE')
+    parser.add_argument('--max-regression', type=float, metavar='PERCENT',
+                        help='fail when a case got slower than this')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='how many measures to take per case')
+    parser.add_argument('--min-time', type=float, default=0.05,
+                        help='minimum duration of a measure, in seconds')
+    args = parser.parse_args(argv)
+
+    results = run_cases(args.cases, args.repeat, args.min_time)
+    output = {
+        'description': 'Flask-RESTful %s on %s %s' % (
+            __version__, platform.python_implementation(),
+            platform.python_version()),
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.max_regression):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
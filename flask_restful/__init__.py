@@ -8,8 +8,9 @@ from flask.signals import got_request_exception
 from werkzeug.datastructures import Headers
 from werkzeug.exceptions import HTTPException, MethodNotAllowed, NotFound, NotAcceptable, InternalServerError
 from werkzeug.wrappers import Response as ResponseBase
-from flask_restful.utils import http_status_message, unpack, OrderedDict
+from flask_restful.utils import http_status_message, unpack, OrderedDict, LazyMarshal, extract_refs
 from flask_restful.representations.json import output_json
+from flask_restful import profiling
 import sys
 from types import MethodType
 import operator
@@ -20,7 +21,7 @@ except ImportError:
 
 _PROPAGATE_EXCEPTIONS = 'PROPAGATE_EXCEPTIONS'
 
-__all__ = ('Api', 'Resource', 'marshal', 'marshal_with', 'marshal_with_field', 'abort')
+__all__ = ('Api', 'Resource', 'marshal', 'marshal_iter', 'async_marshal', 'marshal_with', 'marshal_with_field', 'abort')
 
 
 def abort(http_status_code, **kwargs):
@@ -117,6 +118,7 @@ class Api(object):
         self.resources = []
         self.app = None
         self.blueprint = None
+        self.profiling = False
 
         if app is not None:
             self.app = app
@@ -226,6 +228,9 @@ class Api(object):
             for resource, urls, kwargs in self.resources:
                 self._register_view(app, resource, *urls, **kwargs)
 
+        if self.profiling:
+            app.before_request(_enable_profiling_in_debug)
+
     def owns_endpoint(self, endpoint):
         """Tests if an endpoint name (not path) belongs to this Api.  Takes
         in to account the Blueprint name part of the endpoint name.
@@ -434,6 +439,28 @@ class Api(object):
             return cls
         return decorator
 
+    def add_profiling_resource(self, *urls, **kwargs):
+        """Adds a resource serving the statistics of
+        :mod:`flask_restful.profiling`: ``GET`` returns them, slowest field
+        first, and ``DELETE`` resets them. The resource only answers while
+        the application runs in debug mode, and the timing of marshalled
+        fields is turned on by the first request served in debug mode, never
+        outside of it. Parameters are the same as
+        :meth:`~flask_restful.Api.add_resource`, the url defaults to
+        ``/_profiling/marshal``.
+
+        Example::
+
+            api.add_profiling_resource()
+
+        """
+        kwargs.setdefault('endpoint', 'marshal_profiling')
+        self.add_resource(ProfilingResource, *(urls or ('/_profiling/marshal',)),
+                          **kwargs)
+        self.profiling = True
+        if self.app is not None:
+            self.app.before_request(_enable_profiling_in_debug)
+
     def _register_view(self, app, resource, *urls, **kwargs):
         endpoint = kwargs.pop('endpoint', None) or resource.__name__.lower()
         self.endpoints.add(endpoint)
@@ -518,6 +545,7 @@ class Api(object):
         )
         if mediatype is None:
             raise NotAcceptable()
+        data = _resolve(data, self.representations.get(mediatype))
         if mediatype in self.representations:
             resp = self.representations[mediatype](data, *args, **kwargs)
             resp.headers['Content-Type'] = mediatype
@@ -612,6 +640,7 @@ class Resource(MethodView):
         mediatype = request.accept_mimetypes.best_match(representations, default=None)
         if mediatype in representations:
             data, code, headers = unpack(resp)
+            data = _resolve(data, representations[mediatype])
             resp = representations[mediatype](data, code, headers)
             resp.headers['Content-Type'] = mediatype
             return resp
@@ -619,7 +648,30 @@ class Resource(MethodView):
         return resp
 
 
-def marshal(data, fields, envelope=None):
+def _enable_profiling_in_debug():
+    if current_app.debug and not profiling.enabled:
+        profiling.enable()
+
+
+class ProfilingResource(Resource):
+    """Serves the marshalling statistics collected by
+    :mod:`flask_restful.profiling`, see
+    :meth:`~flask_restful.Api.add_profiling_resource`"""
+
+    def get(self):
+        if not current_app.debug:
+            abort(404)
+        return {'fields': profiling.get_stats()}
+
+    def delete(self):
+        if not current_app.debug:
+            abort(404)
+        profiling.reset()
+        return '', 204
+
+
+def marshal(data, fields, envelope=None, only=None, executor=None,
+            chunk_size=1000, columns=None):
     """Takes raw data (in the form of a dict, list, object) and a dict of
     fields to output and filters the data based on those fields.
 
@@ -628,6 +680,19 @@ def marshal(data, fields, envelope=None):
                    response output
     :param envelope: optional key that will be used to envelop the serialized
                      response
+    :param only: optional sparse fieldset, e.g. ``'id,name,owner(id)'``;
+                 fields that are not selected are not evaluated at all, see
+                 :meth:`fields.CompiledSchema.select`
+    :param executor: optional :class:`concurrent.futures.Executor` on which
+                     lists are marshalled concurrently, ``chunk_size`` items
+                     at a time, see :meth:`fields.CompiledSchema.marshal_parallel`
+    :param int chunk_size: how many items each task of ``executor`` marshals
+    :param columns: optional column names, or a DB-API ``cursor.description``,
+                    to marshal plain tuple rows, see
+                    :meth:`fields.CompiledSchema.positional`
+
+    ``fields`` may also be a plan built by :func:`fields.compile`, which
+    skips re-reading the fields dict on every call.
 
 
     >>> from flask_restful import fields, marshal
@@ -647,16 +712,121 @@ def marshal(data, fields, envelope=None):
             return cls()
         return cls
 
+    if (columns is not None or only is not None
+            or executor is not None) and isinstance(fields, Mapping):
+        # dicts of fields marshal to OrderedDicts, whatever the options
+        fields = _compile(fields, ordered=True)
+
+    if columns is not None:
+        fields = fields.positional(columns)
+
+    if only is not None:
+        fields = _compile(fields).select(only)
+
+    if executor is not None and fields._is_rows(data):
+        return fields.marshal_parallel(data, executor, chunk_size, envelope)
+
+    if not isinstance(fields, Mapping):
+        # a CompiledSchema, see fields.compile
+        return fields.marshal(data, envelope)
+
     if isinstance(data, (list, tuple)):
+        if _uses_loaders(fields):
+            # compiled schemas call the loaders once for all the items
+            return _compile(fields, ordered=True).marshal(data, envelope)
         return (OrderedDict([(envelope, [marshal(d, fields) for d in data])])
                 if envelope else [marshal(d, fields) for d in data])
 
-    items = ((k, marshal(data, v) if isinstance(v, dict)
-              else make(v).output(k, data))
-             for k, v in fields.items())
+    if profiling.enabled:
+        name = profiling.schema_name(fields)
+        items = ((k, marshal(data, v) if isinstance(v, dict)
+                  else profiling.output(name, k, make(v), data))
+                 for k, v in fields.items())
+    else:
+        items = ((k, marshal(data, v) if isinstance(v, dict)
+                  else make(v).output(k, data))
+                 for k, v in fields.items())
     return OrderedDict([(envelope, OrderedDict(items))]) if envelope else OrderedDict(items)
 
 
+def marshal_iter(data, fields, chunk_size=100, columns=None):
+    """Lazily marshals the items of any iterable (a generator, a database
+    cursor, ...) and yields them one by one, see :func:`marshal`. Returning
+    the generator from a resource streams it to the client as a JSON array
+    without building the whole response in memory.
+
+    :param data: an iterable of objects to marshal
+    :param fields: a dict of whose keys will make up the final serialized
+                   response output, or a plan built by :func:`fields.compile`
+    :param int chunk_size: how many items to marshal at once
+    :param columns: optional column names, or a DB-API ``cursor.description``,
+                    to marshal plain tuple rows, e.g. straight from a cursor,
+                    see :meth:`fields.CompiledSchema.positional`
+
+
+    >>> from flask_restful import fields, marshal_iter
+    >>> mfields = { 'a': fields.Raw }
+    >>> list(marshal_iter(({'a': i} for i in range(2)), mfields))
+    [{'a': 0}, {'a': 1}]
+
+    """
+    fields = _compile(fields)
+    if columns is not None:
+        fields = fields.positional(columns)
+    return fields.marshal_iter(data, chunk_size)
+
+
+def async_marshal(data, fields, envelope=None):
+    """Like :func:`marshal`, for objects whose attributes may be awaitable,
+    e.g. coroutines fetching related data from an async client. Returns a
+    coroutine. Needs Python 3.5 or later.
+
+    The awaitable values are gathered level by level: all the awaitable
+    attributes of all the items of a list are awaited concurrently, then
+    those of the objects they nest, and so on. Loaders of :class:`fields.Nested`
+    and :class:`fields.List` fields may be coroutine functions too.
+    Attributes read by fields with their own ``output``, such as
+    :class:`fields.Url` or :class:`fields.FormattedString`, and the
+    intermediate objects of dotted attributes must not be awaitable.
+
+    :param data: the actual object(s) from which the fields are taken from,
+                 or an awaitable returning them
+    :param fields: a dict of whose keys will make up the final serialized
+                   response output, or a plan built by :func:`fields.compile`
+    :param envelope: optional key that will be used to envelop the serialized
+                     response
+
+
+    >>> import asyncio
+    >>> from flask_restful import fields, async_marshal
+    >>> data = { 'a': asyncio.sleep(0, result=100), 'b': 'foo' }
+    >>> mfields = { 'a': fields.Raw }
+    >>> asyncio.run(async_marshal(data, mfields))
+    OrderedDict([('a', 100)])
+
+    """
+    from flask_restful._async import async_marshal
+    return async_marshal(data, fields, envelope)
+
+
+def _resolve(data, representation):
+    # only output_json knows how to encode a LazyMarshal in one pass
+    if isinstance(data, LazyMarshal) and representation is not output_json:
+        return data.marshal()
+    return data
+
+
+def _compile(fields, ordered=None, memoize=None):
+    # fields imports this module, it can't be imported at the top
+    from flask_restful.fields import compile
+    return compile(fields, ordered, memoize)
+
+
+def _uses_loaders(fields):
+    from flask_restful.fields import _uses_loaders
+    return _uses_loaders(fields)
+
+
 class marshal_with(object):
     """A decorator that apply marshalling to the return values of your methods.
 
@@ -680,27 +850,129 @@ class marshal_with(object):
 
     see :meth:`flask_restful.marshal`
     """
-    def __init__(self, fields, envelope=None):
+    def __init__(self, fields, envelope=None, compiled=False, stream=False,
+                 fieldset_arg=None, ordered=None, encode_json=False,
+                 memoize=False, refs=False, executor=None, async_=False,
+                 columns=None):
         """
         :param fields: a dict of whose keys will make up the final
                        serialized response output
         :param envelope: optional key that will be used to envelop the serialized
                          response
+        :param compiled: compile ``fields`` once with :func:`fields.compile`
+                         instead of interpreting the dict on every call
+        :param stream: marshal the returned iterable lazily with
+                       :func:`marshal_iter`, implies ``compiled``
+        :param fieldset_arg: name of a query string argument through which
+                             clients select the fields they want, e.g.
+                             ``?fields=id,owner(email)``, implies ``compiled``
+        :param ordered: build :class:`~collections.OrderedDict` objects
+                        (``True``) or plain dicts (``False``), implies
+                        ``compiled``. Compiled schemas build plain dicts by
+                        default on Python 3.7 and later.
+        :param encode_json: let the JSON representation marshal and encode
+                            the response in one pass, straight to bytes,
+                            implies ``compiled``. The decorated function
+                            then returns a :class:`utils.LazyMarshal`.
+                            Ignored when ``stream`` is set.
+        :param memoize: marshal nested objects showing up several times in
+                        a list only once, implies ``compiled``, see
+                        :class:`fields.CompiledSchema`
+        :param refs: write the nested objects showing up several times in
+                     a list once, in a ``$refs`` table, and ``{"$ref": n}``
+                     pointers in their place, see
+                     :func:`utils.extract_refs`. Implies ``memoize``,
+                     ignored when ``stream`` is set. Clients can also ask
+                     for this output through the
+                     :func:`representations.json.output_json_refs`
+                     representation.
+        :param executor: marshal returned lists concurrently on this
+                         :class:`concurrent.futures.Executor`, see
+                         :func:`marshal`. Implies ``compiled``, ignored when
+                         ``stream`` or ``encode_json`` is set.
+        :param async_: marshal with :func:`async_marshal`, awaiting the
+                       awaitable attributes concurrently. The decorated
+                       function may then be a coroutine function. The
+                       marshalling runs in an event loop of its own, and
+                       the decorated method returns the marshalled
+                       response, not a coroutine. Needs Python 3.5 or
+                       later, ``stream``, ``encode_json`` and ``executor``
+                       are ignored.
+        :param columns: the names of the columns of the plain tuple rows
+                        the decorated function returns, see
+                        :meth:`fields.CompiledSchema.positional`. Implies
+                        ``compiled``. Since a returned tuple is unpacked as
+                        ``(data, code, headers)``, return a single row
+                        together with a status code.
         """
+        memoize = memoize or refs
+        if (compiled or stream or encode_json or memoize
+                or executor is not None or fieldset_arg is not None
+                or ordered is not None or columns is not None):
+            fields = _compile(fields, ordered, memoize or None)
+        if columns is not None:
+            fields = fields.positional(columns)
         self.fields = fields
         self.envelope = envelope
+        self.stream = stream
+        self.encode_json = encode_json
+        self.refs = refs
+        self.executor = executor
+        self.fieldset_arg = fieldset_arg
+        self.async_ = async_
 
     def __call__(self, f):
+        if self.async_:
+            return self._async_wrapper(f)
+
         @wraps(f)
         def wrapper(*args, **kwargs):
             resp = f(*args, **kwargs)
             if isinstance(resp, tuple):
                 data, code, headers = unpack(resp)
-                return marshal(data, self.fields, self.envelope), code, headers
+                return self._marshal(data), code, headers
             else:
-                return marshal(resp, self.fields, self.envelope)
+                return self._marshal(resp)
         return wrapper
 
+    def _async_wrapper(self, f):
+        from flask_restful import _async
+
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            resp = _async.run(_async.call_marshalled(
+                f, args, kwargs, self._selected_fields(), self.envelope))
+            if self.refs:
+                if isinstance(resp, tuple):
+                    data, code, headers = unpack(resp)
+                    return extract_refs(data), code, headers
+                return extract_refs(resp)
+            return resp
+        return wrapper
+
+    def _selected_fields(self):
+        fields = self.fields
+        if self.fieldset_arg is not None:
+            fieldset = request.args.get(self.fieldset_arg)
+            if fieldset:
+                try:
+                    fields = fields.select(fieldset)
+                except ValueError as e:
+                    abort(400, message={self.fieldset_arg: str(e)})
+        return fields
+
+    def _marshal(self, data):
+        fields = self._selected_fields()
+        if self.stream:
+            items = marshal_iter(data, fields)
+            return OrderedDict([(self.envelope, items)]) if self.envelope else items
+        if self.refs:
+            return extract_refs(marshal(data, fields, self.envelope,
+                                        executor=self.executor))
+        if self.encode_json:
+            return LazyMarshal(fields, data, self.envelope)
+        return marshal(data, fields, self.envelope, executor=self.executor)
+
 
 class marshal_with_field(object):
     """
@@ -0,0 +1,153 @@
+"""Marshalling of objects whose attributes are awaitable, see
+:func:`flask_restful.async_marshal`. Needs Python 3.5 or later, this module
+is only imported when used.
+"""
+import asyncio
+from inspect import isawaitable
+
+from flask_restful.fields import (compile, _FieldStep, _NestedStep,
+                                  _ListOfNestedStep, _SchemaStep, _OutputStep,
+                                  _distinct, _is_list_like)
+from flask_restful.utils import OrderedDict, unpack
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+async def async_marshal(data, fields, envelope=None):
+    plan = compile(fields, ordered=True) if isinstance(fields, Mapping) else fields
+    if isawaitable(data):
+        data = await data
+    if plan._is_rows(data):
+        data = list(data)
+        await _resolve([data])
+        if any(plan._is_rows(d) for d in data):
+            items = list(await asyncio.gather(
+                *[async_marshal(d, plan) for d in data]))
+        else:
+            items = await _marshal_many(plan, data)
+    else:
+        items = (await _marshal_many(plan, [data]))[0]
+    return plan.dict_class([(envelope, items)]) if envelope else items
+
+
+async def call_marshalled(func, args, kwargs, fields, envelope):
+    """Call ``func`` and marshal what it returns, as :class:`marshal_with`
+    does, awaiting the response itself if needed"""
+    resp = func(*args, **kwargs)
+    if isawaitable(resp):
+        resp = await resp
+    if isinstance(resp, tuple):
+        data, code, headers = unpack(resp)
+        return await async_marshal(data, fields, envelope), code, headers
+    return await async_marshal(resp, fields, envelope)
+
+
+def run(coroutine):
+    """Run ``coroutine`` to completion in an event loop of its own"""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def _marshal_many(plan, objs):
+    if not plan.steps:
+        return [plan.dict_class() for _ in objs]
+    # read every field of every object, then wait for all the awaitable
+    # values of this level at once
+    columns = [[step.getter(obj) for obj in objs]
+               if isinstance(step, (_FieldStep, _NestedStep, _ListOfNestedStep))
+               else None
+               for step in plan.steps]
+    await _resolve(columns)
+    # the next levels of the nested fields are resolved concurrently too
+    columns = await asyncio.gather(*[_format(step, column, objs)
+                                     for step, column in zip(plan.steps, columns)])
+    keys = plan.keys
+    dict_class = plan.dict_class
+    return [dict_class(zip(keys, row)) for row in zip(*columns)]
+
+
+async def _format(step, values, objs):
+    if isinstance(step, _FieldStep):
+        return step.format_many(values)
+    if isinstance(step, _NestedStep):
+        return await _format_nested(step, values)
+    if isinstance(step, _ListOfNestedStep):
+        return await _format_list_of_nested(step, values)
+    if isinstance(step, _SchemaStep):
+        return await _marshal_many(step.plan, objs)
+    # a field with its own output, which may return an awaitable
+    assert isinstance(step, _OutputStep)
+    values = step.output_many(objs)
+    await _resolve([values])
+    return values
+
+
+async def _format_nested(step, values):
+    if step.loader is not None:
+        values = await _load(step.loader, values)
+    batch = [value for value in values
+             if value is not None and not isinstance(value, (list, tuple))]
+    if step.memoize:
+        distinct, positions = _distinct(batch)
+        marshalled = await _marshal_many(step.plan, distinct)
+        marshalled = iter([marshalled[position] for position in positions])
+    else:
+        marshalled = iter(await _marshal_many(step.plan, batch))
+    return [next(marshalled)
+            if value is not None and not isinstance(value, (list, tuple))
+            else step._format_loaded(value)
+            for value in values]
+
+
+async def _format_list_of_nested(step, values):
+    if step.loader is not None:
+        values = await _load(step.loader, values)
+    elements = []
+    bounds = []
+    for value in values:
+        if _is_list_like(value):
+            start = len(elements)
+            elements.extend(step._elements(value))
+            bounds.append((start, len(elements)))
+        else:
+            bounds.append(None)
+    await _resolve([elements])
+    marshalled = await _format_nested(step.nested, elements)
+    return [marshalled[bound[0]:bound[1]] if bound is not None
+            else step.format(value)
+            for value, bound in zip(values, bounds)]
+
+
+async def _load(loader, keys):
+    wanted = list(OrderedDict.fromkeys(key for key in keys if key is not None))
+    loaded = loader(wanted) if wanted else {}
+    if isawaitable(loaded):
+        loaded = await loaded
+    return [None if key is None else loaded.get(key) for key in keys]
+
+
+async def _resolve(columns):
+    """Replace the awaitable values of ``columns`` with their results,
+    awaiting them all concurrently"""
+    places = []
+    awaitables = []
+    for column in columns:
+        if column is None:
+            continue
+        for index, value in enumerate(column):
+            if isawaitable(value):
+                places.append((column, index))
+                awaitables.append(value)
+    if not awaitables:
+        return
+    # the same awaitable may show up several times, await it only once
+    distinct, positions = _distinct(awaitables)
+    results = await asyncio.gather(*distinct)
+    for (column, index), position in zip(places, positions):
+        column[index] = results[position]
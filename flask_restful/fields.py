@@ -1,14 +1,43 @@
 from calendar import timegm
-from decimal import Decimal as MyDecimal, ROUND_HALF_EVEN
+from copy import copy
+from datetime import datetime
+from decimal import Context, Decimal as MyDecimal, ROUND_HALF_EVEN
 from email.utils import formatdate
+from functools import partial
+from itertools import islice
+from json import dumps
+from json.encoder import encode_basestring_ascii
+from operator import itemgetter
+import re
+from string import Formatter
 import six
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 try:
     from urlparse import urlparse, urlunparse
 except ImportError:
     # python3
     from urllib.parse import urlparse, urlunparse
-from flask_restful import marshal
-from flask import url_for, request
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import dataclasses
+except ImportError:
+    # python < 3.7
+    dataclasses = None
+from flask_restful import marshal, profiling
+from flask_restful.utils import OrderedDict, DICT_ORDERED
+from flask import (url_for, request, current_app, has_app_context,
+                   has_request_context, copy_current_request_context)
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    # python 2 without the futures backport
+    ProcessPoolExecutor = None
 
 __all__ = ["String", "FormattedString", "Url", "DateTime", "Float",
            "Integer", "Arbitrary", "Nested", "List", "Raw", "Boolean",
@@ -37,18 +66,68 @@ def get_value(key, obj, default=None):
     elif callable(key):
         return key(obj)
     else:
-        return _get_value_for_keys(key.split('.'), obj, default)
+        return _get_value_for_keys(_split_key(key), obj, default)
 
 
-def _get_value_for_keys(keys, obj, default):
-    if len(keys) == 1:
-        return _get_value_for_key(keys[0], obj, default)
+# Dotted keys seen by get_value, already split. Bounded so that callers
+# building keys on the fly cannot grow it forever.
+_split_keys = {}
+_SPLIT_KEYS_MAX = 1024
+
+
+def _split_key(key):
+    try:
+        return _split_keys[key]
+    except KeyError:
+        keys = tuple(key.split('.'))
+        if len(_split_keys) < _SPLIT_KEYS_MAX:
+            _split_keys[key] = keys
+        return keys
+
+
+def _make_getter(key):
+    """Resolve ``key`` once into a callable pulling its value off an object.
+
+    The callable takes ``(obj, default=None)`` and returns the same thing as
+    ``get_value(key, obj, default)``, without parsing ``key`` again.
+
+    :param key: an integer index, a callable or a (dotted) attribute name
+    """
+    if isinstance(key, int):
+        return partial(_get_value_for_key, key)
+    elif callable(key):
+        return partial(_get_value_for_callable, key)
     else:
-        return _get_value_for_keys(
-            keys[1:], _get_value_for_key(keys[0], obj, default), default)
+        return partial(_get_value_for_keys, tuple(key.split('.')))
+
+
+def _get_value_for_callable(func, obj, default=None):
+    return func(obj)
+
 
+def _get_value_for_keys(keys, obj, default=None):
+    for key in keys:
+        # plain dicts are by far the most common source, skip the generic
+        # lookup for them
+        if type(obj) is dict:
+            try:
+                obj = obj[key]
+                continue
+            except KeyError:
+                pass
+        obj = _get_value_for_key(key, obj, default)
+    return obj
 
-def _get_value_for_key(key, obj, default):
+
+def _get_value_for_key(key, obj, default=None):
+    try:
+        getter = _type_getters[type(obj)]
+    except KeyError:
+        getter = _type_getter(type(obj))
+    return getter(key, obj, default)
+
+
+def _get_value_generic(key, obj, default):
     if is_indexable_but_not_string(obj):
         try:
             return obj[key]
@@ -57,21 +136,183 @@ def _get_value_for_key(key, obj, default):
     return getattr(obj, key, default)
 
 
+def _get_attr(key, obj, default):
+    return getattr(obj, key, default)
+
+
+def _get_item_or_attr(key, obj, default):
+    try:
+        return obj[key]
+    except (IndexError, TypeError, KeyError):
+        return getattr(obj, key, default)
+
+
+def _get_dict_item(key, obj, default):
+    try:
+        return obj[key]
+    except KeyError:
+        return getattr(obj, key, default)
+
+
+def _get_mapping_item(key, obj, default):
+    value = obj.get(key, _MISSING)
+    if value is _MISSING:
+        return getattr(obj, key, default)
+    return value
+
+
+def _get_sequence_item(key, obj, default):
+    if isinstance(key, int):
+        try:
+            return obj[key]
+        except IndexError:
+            pass
+    # namedtuples and other tuples/lists with attributes
+    return getattr(obj, key, default)
+
+
+# type -> how to pull a key off its instances, filled by _type_getter
+_type_getters = {}
+_TYPE_GETTERS_MAX = 1024
+
+
+def _type_getter(cls):
+    """Decide once per source type how :func:`_get_value_for_key` should read
+    from its instances, instead of probing every object"""
+    if (hasattr(cls, '__getattr__')
+            or cls.__getattribute__ is not object.__getattribute__
+            or issubclass(cls, type)):
+        # attributes may be computed per instance (e.g. mocks, proxies), so
+        # keep probing each object
+        getter = _get_value_generic
+    elif hasattr(cls, 'strip') or not hasattr(cls, '__iter__'):
+        # strings, dataclasses and other plain attribute bags
+        getter = _get_attr
+    elif not hasattr(cls, '__getitem__'):
+        getter = _get_attr
+    elif issubclass(cls, dict) and cls.__getitem__ is dict.__getitem__:
+        getter = _get_dict_item
+    elif issubclass(cls, Mapping) and not issubclass(cls, dict):
+        # mapping views, proxies and other Mapping implementations
+        getter = _get_mapping_item
+    elif ((issubclass(cls, tuple) and cls.__getitem__ is tuple.__getitem__)
+            or (issubclass(cls, list) and cls.__getitem__ is list.__getitem__)):
+        # includes namedtuples
+        getter = _get_sequence_item
+    else:
+        getter = _get_item_or_attr
+
+    if len(_type_getters) >= _TYPE_GETTERS_MAX:
+        # classes created on the fly must not grow the cache forever
+        _type_getters.clear()
+    _type_getters[cls] = getter
+    return getter
+
+
+def _is_array(values):
+    return numpy is not None and isinstance(values, numpy.ndarray)
+
+
+def _is_numeric_array(values):
+    # NaN and infinite values cannot be converted to integers, leave them to
+    # the per-value path which reports them
+    return (_is_array(values) and values.dtype.kind in 'biuf'
+            and (values.dtype.kind != 'f' or numpy.isfinite(values).all()))
+
+
 def to_marshallable_type(obj):
     """Helper for converting an object to a dictionary only if it is not
-    dictionary already or an indexable object nor a simple type"""
+    dictionary already or an indexable object nor a simple type.
+
+    Namedtuples, dataclasses and objects with ``__slots__`` are converted to
+    a dictionary of their fields."""
+    data = _marshallable_view(obj)
+    return dict(data) if isinstance(data, _AttributeView) else data
+
+
+def _marshallable_view(obj):
+    # like to_marshallable_type, but the fields of namedtuples, dataclasses
+    # and objects with __slots__ are read off the object instead of copied
     if obj is None:
         return None  # make it idempotent for None
 
     if hasattr(obj, '__marshallable__'):
         return obj.__marshallable__()
 
+    names = _attribute_names(type(obj))
+    if names is not None:
+        return _AttributeView(obj, names)
+
     if hasattr(obj, '__getitem__'):
         return obj  # it is indexable it is ok
 
     return dict(obj.__dict__)
 
 
+# type -> the names of the fields of its instances, see _attribute_names
+_type_attribute_names = {}
+
+
+def _attribute_names(cls):
+    """Return the names of the fields of a namedtuple, dataclass or class
+    with ``__slots__``, or ``None`` for other classes"""
+    try:
+        return _type_attribute_names[cls]
+    except KeyError:
+        pass
+    if issubclass(cls, tuple) and hasattr(cls, '_fields'):
+        names = tuple(cls._fields)
+    elif hasattr(cls, '__getitem__'):
+        names = None
+    elif dataclasses is not None and dataclasses.is_dataclass(cls):
+        names = tuple(field.name for field in dataclasses.fields(cls))
+    elif any('__slots__' in vars(base) for base in cls.__mro__):
+        # attributes set outside of the slots, if any, are read off __dict__
+        names = tuple(name for base in reversed(cls.__mro__)
+                      for name in _slot_names(base)
+                      if name not in ('__dict__', '__weakref__'))
+    else:
+        names = None
+    if len(_type_attribute_names) >= _TYPE_GETTERS_MAX:
+        _type_attribute_names.clear()
+    _type_attribute_names[cls] = names
+    return names
+
+
+def _slot_names(cls):
+    slots = vars(cls).get('__slots__', ())
+    return (slots,) if isinstance(slots, six.string_types) else slots
+
+
+class _AttributeView(Mapping):
+    """The fields of an object as a read only mapping, see
+    :func:`_marshallable_view`"""
+    __slots__ = ('_obj', '_names')
+
+    def __init__(self, obj, names):
+        self._obj = obj
+        self._names = names
+
+    def __getitem__(self, key):
+        if key in self._names or key in getattr(self._obj, '__dict__', ()):
+            value = getattr(self._obj, key, _MISSING)
+            if value is not _MISSING:
+                return value
+        raise KeyError(key)
+
+    def __iter__(self):
+        for name in self._names:
+            # unset slots are left out
+            if getattr(self._obj, name, _MISSING) is not _MISSING:
+                yield name
+        for name in getattr(self._obj, '__dict__', ()):
+            if name not in self._names:
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
 class Raw(object):
     """Raw provides a base field class from which others should extend. It
     applies no formatting by default, and should only be used in cases where
@@ -84,11 +325,40 @@ class Raw(object):
         value, use this to retrieve a different attribute from the response
         than the publicly named value.
     """
+    __slots__ = ('_attribute', '_getter', 'default')
 
     def __init__(self, default=None, attribute=None):
         self.attribute = attribute
         self.default = default
 
+    @property
+    def attribute(self):
+        return self._attribute
+
+    @attribute.setter
+    def attribute(self, attribute):
+        # resolve the attribute path once instead of on every output
+        self._attribute = attribute
+        self._getter = None if attribute is None else _make_getter(attribute)
+
+    def __getstate__(self):
+        # fields have __slots__, subclasses without them also have a __dict__
+        state = dict(getattr(self, '__dict__', ()))
+        for cls in type(self).__mro__:
+            for name in _slot_names(cls):
+                if hasattr(self, name):
+                    state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
+    def _get_value(self, key, obj):
+        if self._getter is None:
+            return get_value(key, obj)
+        return self._getter(obj)
+
     def format(self, value):
         """Formats a field's value. No-op by default - field classes that
         modify how the value of existing object keys should be presented should
@@ -105,6 +375,22 @@ class Raw(object):
         """
         return value
 
+    def format_many(self, values):
+        """Formats the values of this field for many objects at once, as
+        :meth:`output` would: ``None`` becomes the default value, anything
+        else goes through :meth:`format`. Compiled schemas (see
+        :func:`compile`) use it to format a whole column in one pass, field
+        classes may override it with a faster bulk conversion.
+
+        :param values: The values to format, a list or a NumPy array
+        :exception MarshallingException: In case of formatting problem
+        """
+        if _is_array(values):
+            values = values.tolist()
+        default = self.default
+        format = self.format
+        return [default if value is None else format(value) for value in values]
+
     def output(self, key, obj):
         """Pulls the value for the given key from the object, applies the
         field's formatting and returns the result. If the key is not found
@@ -115,7 +401,7 @@ class Raw(object):
         :exception MarshallingException: In case of formatting problem
         """
 
-        value = get_value(key if self.attribute is None else self.attribute, obj)
+        value = self._get_value(key, obj)
 
         if value is None:
             return self.default
@@ -134,15 +420,25 @@ class Nested(Raw):
         dictionary will be marshaled as its value if nested dictionary is
         all-null keys (e.g. lets you return an empty JSON object instead of
         null)
+    :param loader: A function loading the nested objects in batches: the
+        value read off each object is a key (e.g. a foreign key), the loader
+        is passed a list of distinct keys and returns a dict mapping them to
+        the objects to nest. Keys missing from the dict nest ``None``. When
+        a list is marshalled, the loader is called once for all its items,
+        see :ref:`batch-loading`.
     """
+    __slots__ = ('nested', 'allow_null', 'loader')
 
-    def __init__(self, nested, allow_null=False, **kwargs):
+    def __init__(self, nested, allow_null=False, loader=None, **kwargs):
         self.nested = nested
         self.allow_null = allow_null
+        self.loader = loader
         super(Nested, self).__init__(**kwargs)
 
     def output(self, key, obj):
-        value = get_value(key if self.attribute is None else self.attribute, obj)
+        value = self._get_value(key, obj)
+        if self.loader is not None:
+            value = _load(self.loader, [value])[0]
         if value is None:
             if self.allow_null:
                 return None
@@ -152,6 +448,12 @@ class Nested(Raw):
         return marshal(value, self.nested)
 
 
+# how List formats the elements of lists, see List.container
+_SCALAR_ELEMENTS = 'scalar'
+_NESTED_ELEMENTS = 'nested'
+_ATTRIBUTE_ELEMENTS = 'attribute'
+
+
 class List(Raw):
     """
     Field for marshalling lists of other fields.
@@ -159,10 +461,15 @@ class List(Raw):
     See :ref:`list-field` for more information.
 
     :param cls_or_instance: The field type the list will contain.
+    :param loader: A function loading the lists in batches, like the
+        ``loader`` of :class:`Nested`: it is passed a list of distinct keys
+        and returns a dict mapping them to lists.
     """
+    __slots__ = ('loader', '_container', '_elements_kind')
 
-    def __init__(self, cls_or_instance, **kwargs):
+    def __init__(self, cls_or_instance, loader=None, **kwargs):
         super(List, self).__init__(**kwargs)
+        self.loader = loader
         error_msg = ("The type of the list elements must be a subclass of "
                      "flask_restful.fields.Raw")
         if isinstance(cls_or_instance, type):
@@ -174,11 +481,71 @@ class List(Raw):
                 raise MarshallingException(error_msg)
             self.container = cls_or_instance
 
+    @property
+    def container(self):
+        return self._container
+
+    @container.setter
+    def container(self, container):
+        # decide once how the elements are formatted, instead of testing
+        # every element; changes made to the container afterwards are not
+        # picked up
+        self._container = container
+        cls = type(container)
+        if cls.output is Nested.output and container._getter is None:
+            self._elements_kind = _NESTED_ELEMENTS
+        elif cls.output is Raw.output and container._getter is None:
+            self._elements_kind = _SCALAR_ELEMENTS
+        elif (cls.output is Raw.output and cls is not Raw
+              and isinstance(container.attribute, six.string_types)):
+            self._elements_kind = _ATTRIBUTE_ELEMENTS
+        else:
+            self._elements_kind = None
+
     def format(self, value):
         # Convert all instances in typed list to container type
         if isinstance(value, set):
             value = list(value)
 
+        kind = self._elements_kind
+        if kind is None or type(value) not in (list, tuple):
+            return self._format_elements(value)
+        container = self.container
+
+        if kind == _SCALAR_ELEMENTS:
+            # dicts are looked up by index, see _format_elements; format_many
+            # only takes its bulk conversions when format is not overridden
+            if type(container) is Raw or not any(
+                    isinstance(val, dict) for val in value):
+                return container.format_many(value)
+            return self._format_elements(value)
+
+        if kind == _NESTED_ELEMENTS:
+            if container.loader is not None:
+                value = _load(container.loader, value)
+            nested = container.nested
+            if container.allow_null:
+                missing = None
+            elif container.default is not None:
+                missing = container.default
+            else:
+                missing = _MISSING
+            return [marshal(val, nested) if val is not None or missing is _MISSING
+                    else missing
+                    for val in value]
+
+        # the attribute is read off the elements which have it, and off the
+        # list itself for the others
+        attribute = container.attribute
+        getter = container._getter
+        default = container.default
+        format = container.format
+        values = [getter(val if isinstance(val, dict) or hasattr(val, attribute)
+                         else value)
+                  for val in value]
+        return [default if val is None else format(val) for val in values]
+
+    def _format_elements(self, value):
         return [
             self.container.output(idx,
                 val if (isinstance(val, dict)
@@ -191,7 +558,9 @@ class List(Raw):
         ]
 
     def output(self, key, data):
-        value = get_value(key if self.attribute is None else self.attribute, data)
+        value = self._get_value(key, data)
+        if self.loader is not None:
+            value = _load(self.loader, [value])[0]
         # we cannot really test for external dict behavior
         if is_indexable_but_not_string(value) and not isinstance(value, dict):
             return self.format(value)
@@ -208,6 +577,8 @@ class String(Raw):
     be converted to :class:`unicode` in python2 and :class:`str` in
     python3.
     """
+    __slots__ = ()
+
     def format(self, value):
         try:
             return six.text_type(value)
@@ -221,6 +592,8 @@ class Integer(Raw):
     :param int default: The default value for the field, if no value is
         specified.
     """
+    __slots__ = ()
+
     def __init__(self, default=0, **kwargs):
         super(Integer, self).__init__(default=default, **kwargs)
 
@@ -232,6 +605,18 @@ class Integer(Raw):
         except ValueError as ve:
             raise MarshallingException(ve)
 
+    def format_many(self, values):
+        if type(self).format is not Integer.format:
+            # the bulk conversion would skip the subclass' format
+            return super(Integer, self).format_many(values)
+        if _is_numeric_array(values):
+            return values.astype(int).tolist()
+        try:
+            return list(map(int, values))
+        except (TypeError, ValueError):
+            # None values or invalid ones, let format deal with them
+            return super(Integer, self).format_many(values)
+
 
 class Boolean(Raw):
     """
@@ -240,9 +625,16 @@ class Boolean(Raw):
     Empty collections such as ``""``, ``{}``, ``[]``, etc. will be converted to
     ``False``.
     """
+    __slots__ = ()
+
     def format(self, value):
         return bool(value)
 
+    def format_many(self, values):
+        if type(self).format is Boolean.format and _is_numeric_array(values):
+            return values.astype(bool).tolist()
+        return super(Boolean, self).format_many(values)
+
 
 class FormattedString(Raw):
     """
@@ -262,6 +654,8 @@ class FormattedString(Raw):
         }
         marshal(data, fields)
     """
+    __slots__ = ('_src_str', '_names')
+
     def __init__(self, src_str):
         """
         :param string src_str: the string to format with the other
@@ -270,14 +664,62 @@ class FormattedString(Raw):
         super(FormattedString, self).__init__()
         self.src_str = six.text_type(src_str)
 
+    @property
+    def src_str(self):
+        return self._src_str
+
+    @src_str.setter
+    def src_str(self, src_str):
+        # parse the template once to read only the values it uses
+        self._src_str = src_str
+        self._names = _format_names(src_str)
+
     def output(self, key, obj):
         try:
-            data = to_marshallable_type(obj)
-            return self.src_str.format(**data)
+            if hasattr(obj, '__marshallable__'):
+                obj = obj.__marshallable__()
+            if (obj is not None and not hasattr(obj, '__getitem__')
+                    and _attribute_names(type(obj)) is None):
+                # no need to copy the attributes to read a few of them
+                data = obj.__dict__
+            else:
+                data = _marshallable_view(obj)
+            if self._names is None or not isinstance(data, Mapping):
+                # let str.format raise the same errors as always
+                return self.src_str.format(**data)
+            return self.src_str.format(
+                **dict((name, data[name]) for name in self._names))
         except (TypeError, IndexError) as error:
             raise MarshallingException(error)
 
 
+_MISSING = object()
+
+
+def _format_names(src_str):
+    """Return the names of the keyword arguments ``src_str.format`` reads, or
+    ``None`` if it reads positional arguments or cannot be parsed"""
+    names = set()
+    try:
+        parsed = list(Formatter().parse(src_str))
+    except ValueError:
+        return None
+    for _, field_name, format_spec, _ in parsed:
+        if field_name is None:
+            continue
+        name = re.split(r'[.\[]', field_name, 1)[0]
+        if not name or name.isdigit():
+            return None
+        names.add(name)
+        if format_spec:
+            # nested replacement fields, e.g. "{value:{width}}"
+            nested = _format_names(format_spec)
+            if nested is None:
+                return None
+            names.update(nested)
+    return tuple(names)
+
+
 class Url(Raw):
     """
     A string representation of a Url
@@ -291,24 +733,99 @@ class Url(Raw):
     :param scheme: URL scheme specifier (e.g. ``http``, ``https``)
     :type scheme: str
     """
+    __slots__ = ('endpoint', 'absolute', 'scheme', '_templates')
+
     def __init__(self, endpoint=None, absolute=False, scheme=None, **kwargs):
         super(Url, self).__init__(**kwargs)
         self.endpoint = endpoint
         self.absolute = absolute
         self.scheme = scheme
+        # url templates per app, endpoint and request root, see _UrlTemplate
+        self._templates = {}
 
     def output(self, key, obj):
         try:
-            data = to_marshallable_type(obj)
             endpoint = self.endpoint if self.endpoint is not None else request.endpoint
-            o = urlparse(url_for(endpoint, _external=self.absolute, **data))
-            if self.absolute:
-                scheme = self.scheme if self.scheme is not None else o.scheme
-                return urlunparse((scheme, o.netloc, o.path, "", "", ""))
-            return urlunparse(("", "", o.path, "", "", ""))
+            cache_key = (current_app._get_current_object(), endpoint,
+                         request.url_root if has_request_context() else None)
+            template = self._templates.get(cache_key)
+            if template is not None:
+                url = template.build(obj)
+                if url is not None:
+                    return url
+            url = self._url_for(endpoint, _marshallable_view(obj))
+            if cache_key not in self._templates:
+                if len(self._templates) >= _URL_TEMPLATES_MAX:
+                    self._templates.clear()
+                self._templates[cache_key] = _UrlTemplate.compile(
+                    endpoint, url, obj)
+            return url
         except TypeError as te:
             raise MarshallingException(te)
 
+    def __getstate__(self):
+        # the cached templates hold applications, start over when unpickled
+        state = super(Url, self).__getstate__()
+        state['_templates'] = {}
+        return state
+
+    def _url_for(self, endpoint, data):
+        o = urlparse(url_for(endpoint, _external=self.absolute, **data))
+        if self.absolute:
+            scheme = self.scheme if self.scheme is not None else o.scheme
+            return urlunparse((scheme, o.netloc, o.path, "", "", ""))
+        return urlunparse(("", "", o.path, "", "", ""))
+
+
+_URL_TEMPLATES_MAX = 64
+
+
+class _UrlTemplate(object):
+    """The rule of an endpoint together with what :meth:`Url.output` puts in
+    front of the path it builds for the current app, host and scheme. Urls
+    are then built by the rule alone, reading only its arguments from the
+    object."""
+
+    def __init__(self, rule, prefix):
+        self.rule = rule
+        self.prefix = prefix
+        self.arguments = tuple(rule.arguments)
+
+    @classmethod
+    def compile(cls, endpoint, url, obj):
+        """Return a template for ``endpoint`` matching ``url``, the url built
+        by :func:`flask.url_for` for ``obj``, or ``None`` if the endpoint
+        needs url_for's full logic."""
+        app = current_app
+        if app.url_map.host_matching or any(app.url_default_functions.values()):
+            return None
+        try:
+            rules = list(app.url_map.iter_rules(endpoint))
+        except KeyError:
+            return None
+        if len(rules) != 1:
+            return None
+        rule = rules[0]
+        if rule.defaults or '<' in (rule.subdomain or ''):
+            return None
+        path = cls(rule, '').build(obj)
+        if path is None or not url.endswith(path):
+            return None
+        return cls(rule, url[:len(url) - len(path)])
+
+    def build(self, obj):
+        if hasattr(obj, '__marshallable__'):
+            obj = obj.__marshallable__()
+        values = {}
+        for name in self.arguments:
+            value = _get_value_for_key(name, obj)
+            if value is not None:
+                values[name] = value
+        built = self.rule.build(values, False)
+        if built is None:
+            return None
+        return self.prefix + built[1].lstrip('/')
+
 
 class Float(Raw):
     """
@@ -316,6 +833,7 @@ class Float(Raw):
     ex : 3.141592653589793 3.1415926535897933e-06 3.141592653589793e+24 nan inf
     -inf
     """
+    __slots__ = ()
 
     def format(self, value):
         try:
@@ -323,14 +841,30 @@ class Float(Raw):
         except ValueError as ve:
             raise MarshallingException(ve)
 
+    def format_many(self, values):
+        if type(self).format is not Float.format:
+            # the bulk conversion would skip the subclass' format
+            return super(Float, self).format_many(values)
+        if _is_numeric_array(values):
+            return values.astype(float).tolist()
+        try:
+            return list(map(float, values))
+        except (TypeError, ValueError):
+            return super(Float, self).format_many(values)
+
 
 class Arbitrary(Raw):
     """
         A floating point number with an arbitrary precision
           ex: 634271127864378216478362784632784678324.23432
     """
+    __slots__ = ()
 
     def format(self, value):
+        kind = type(value)
+        if kind is MyDecimal or kind in six.integer_types:
+            # both already print as their exact decimal value
+            return six.text_type(value)
         return six.text_type(MyDecimal(value))
 
 
@@ -346,24 +880,70 @@ class DateTime(Raw):
 
     :param dt_format: ``'rfc822'`` or ``'iso8601'``
     :type dt_format: str
+    :param cache_size: how many of the most recently formatted dates to
+        remember, useful when the same dates come up again and again (e.g.
+        time series bucketed to the minute). ``0`` disables the cache.
+    :type cache_size: int
     """
-    def __init__(self, dt_format='rfc822', **kwargs):
+    __slots__ = ('cache_size', '_dt_format', '_formatter')
+
+    def __init__(self, dt_format='rfc822', cache_size=0, **kwargs):
         super(DateTime, self).__init__(**kwargs)
+        self.cache_size = cache_size
         self.dt_format = dt_format
 
+    @property
+    def dt_format(self):
+        return self._dt_format
+
+    @dt_format.setter
+    def dt_format(self, dt_format):
+        # pick the formatter once instead of on every value
+        self._dt_format = dt_format
+        if dt_format == 'rfc822':
+            formatter = _rfc822
+        elif dt_format == 'iso8601':
+            formatter = _iso8601
+        else:
+            formatter = partial(_unsupported_date_format, dt_format)
+        if self.cache_size:
+            formatter = _DateCache(formatter, self.cache_size)
+        self._formatter = formatter
+
     def format(self, value):
         try:
-            if self.dt_format == 'rfc822':
-                return _rfc822(value)
-            elif self.dt_format == 'iso8601':
-                return _iso8601(value)
-            else:
-                raise MarshallingException(
-                    'Unsupported date format %s' % self.dt_format
-                )
+            return self._formatter(value)
         except AttributeError as ae:
             raise MarshallingException(ae)
 
+
+def _unsupported_date_format(dt_format, value):
+    raise MarshallingException('Unsupported date format %s' % dt_format)
+
+
+class _DateCache(object):
+    """Least recently used cache in front of a date formatter"""
+
+    def __init__(self, formatter, size):
+        self.formatter = formatter
+        self.size = size
+        self.formatted = OrderedDict()
+
+    def __call__(self, value):
+        try:
+            # equal aware datetimes can be in different time zones
+            key = (value, value.tzinfo, getattr(value, 'fold', 0))
+            result = self.formatted.pop(key)
+        except (AttributeError, TypeError):
+            return self.formatter(value)
+        except KeyError:
+            result = self.formatter(value)
+            if len(self.formatted) >= self.size:
+                self.formatted.popitem(last=False)
+        self.formatted[key] = result
+        return result
+
+
 ZERO = MyDecimal()
 
 
@@ -371,15 +951,60 @@ class Fixed(Raw):
     """
     A decimal number with a fixed precision.
     """
+    __slots__ = ('_precision', '_context', '_limit', '_float_format', '_int_format')
+
     def __init__(self, decimals=5, **kwargs):
         super(Fixed, self).__init__(**kwargs)
         self.precision = MyDecimal('0.' + '0' * (decimals - 1) + '1')
 
+    @property
+    def precision(self):
+        return self._precision
+
+    @precision.setter
+    def precision(self, precision):
+        self._precision = precision
+        places = -precision.as_tuple().exponent
+        self._context = Context(rounding=ROUND_HALF_EVEN)
+        # Floats and ints small enough for the quantized result to fit in the
+        # context are written directly: '%.Nf' rounds the exact binary value
+        # half to even just like quantize. With more than 6 places quantize
+        # may produce scientific notation, so everything goes through it.
+        if 0 < places <= 6:
+            self._limit = 10 ** (self._context.prec - places - 1)
+        else:
+            self._limit = 0
+        self._float_format = u'%%.%df' % max(places, 0)
+        self._int_format = u'%d.' + u'0' * places
+
     def format(self, value):
-        dvalue = MyDecimal(value)
-        if not dvalue.is_normal() and dvalue != ZERO:
+        kind = type(value)
+        if kind is float:
+            if -self._limit < value < self._limit:
+                return self._float_format % value
+        elif kind in six.integer_types:
+            if -self._limit < value < self._limit:
+                return self._int_format % value
+        dvalue = value if kind is MyDecimal else MyDecimal(value)
+        context = self._context
+        if not dvalue.is_normal(context) and dvalue != ZERO:
             raise MarshallingException('Invalid Fixed precision number.')
-        return six.text_type(dvalue.quantize(self.precision, rounding=ROUND_HALF_EVEN))
+        return six.text_type(dvalue.quantize(self.precision, context=context))
+
+    def format_many(self, values):
+        if type(self).format is not Fixed.format:
+            # the fast path would skip the subclass' format
+            return super(Fixed, self).format_many(values)
+        if _is_array(values):
+            values = values.tolist()
+        limit = self._limit
+        float_format = self._float_format
+        default = self.default
+        format = self.format
+        return [float_format % value
+                if type(value) is float and -limit < value < limit
+                else default if value is None else format(value)
+                for value in values]
 
 
 """Alias for :class:`~fields.Fixed`"""
@@ -397,9 +1022,25 @@ def _rfc822(dt):
     :type dt: datetime
     :return: A RFC 822 formatted date string
     """
+    if isinstance(dt, datetime):
+        # same output as formatdate without going through a timestamp
+        try:
+            offset = dt.utcoffset()
+            if offset:
+                dt = dt - offset
+            return '%s, %02d %s %04d %02d:%02d:%02d -0000' % (
+                _WEEKDAYS[dt.weekday()], dt.day, _MONTHS[dt.month], dt.year,
+                dt.hour, dt.minute, dt.second)
+        except OverflowError:
+            pass
     return formatdate(timegm(dt.utctimetuple()))
 
 
+_WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = (None, 'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+           'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
 def _iso8601(dt):
     """Turn a datetime object into an ISO8601 formatted date.
 
@@ -412,3 +1053,902 @@ def _iso8601(dt):
     :return: A ISO 8601 formatted date string
     """
     return dt.isoformat()
+
+
+def compile(fields, ordered=None, memoize=None, columns=None):
+    """Turn a dict of fields into a :class:`CompiledSchema`.
+
+    The returned plan can be passed anywhere a dict of fields is accepted
+    (:func:`~flask_restful.marshal`, :class:`~flask_restful.marshal_with`)
+    and does the per-schema work only once: field classes are instantiated,
+    nested dicts and :class:`Nested` fields are compiled into sub-plans.
+    Compiling an already compiled schema returns it unchanged, unless asked
+    for a different ``ordered`` or ``memoize``.
+
+    Ex::
+
+        resource_fields = fields.compile({
+            'id': fields.Integer,
+            'name': fields.String,
+        })
+        marshal(rows, resource_fields)
+
+    :param dict fields: the fields to compile
+    :param bool ordered: see :class:`CompiledSchema`
+    :param bool memoize: see :class:`CompiledSchema`
+    :param columns: see :meth:`CompiledSchema.positional`
+    """
+    if isinstance(fields, CompiledSchema):
+        if ((ordered is None or bool(ordered) == fields.ordered)
+                and (memoize is None or bool(memoize) == fields.memoize)):
+            plan = fields
+        else:
+            if ordered is None:
+                ordered = fields.ordered
+            if memoize is None:
+                memoize = fields.memoize
+            plan = fields._rebuild(ordered, memoize, fields.columns)
+    else:
+        plan = CompiledSchema(fields, ordered, memoize)
+    return plan if columns is None else plan.positional(columns)
+
+
+def _make_field(cls_or_instance):
+    if isinstance(cls_or_instance, type):
+        return cls_or_instance()
+    return cls_or_instance
+
+
+class CompiledSchema(object):
+    """A precomputed marshalling plan for a dict of fields. Use
+    :func:`compile` to build one.
+
+    Lists are marshalled column by column: every field pulls the values of
+    all the objects at once and formats them in a single pass (see
+    :meth:`Raw.format_many`), then the rows are put together. A NumPy
+    structured array is marshalled the same way, reading whole columns off
+    the array.
+
+    The fields dict is read once when the plan is built, later changes to it
+    are not picked up.
+
+    :param dict fields: the fields to compile
+    :param bool ordered: whether to build :class:`~collections.OrderedDict`
+        objects rather than plain dicts. Plain dicts are smaller and faster to
+        build and serialize, and keep their keys in order from Python 3.7 on,
+        where they are the default.
+    :param bool memoize: whether to marshal a nested object only once when
+        it shows up several times in a list, e.g. the same owner for many
+        items. The objects are told apart by identity, and the places where
+        one shows up share the same output dict.
+    :param columns: the names of the columns of the rows to marshal, for a
+        positional plan, see :meth:`positional`
+    """
+
+    def __init__(self, fields, ordered=None, memoize=None, columns=None):
+        self.fields = fields
+        self.ordered = not DICT_ORDERED if ordered is None else bool(ordered)
+        self.memoize = bool(memoize)
+        self.dict_class = OrderedDict if self.ordered else dict
+        self.columns = None if columns is None else _column_names(columns)
+        self._column_index = (None if columns is None else dict(
+            (name, position) for position, name in enumerate(self.columns)))
+        self._selection = None
+        self._set_steps(fields.keys(), [self._compile_step(key, value)
+                                        for key, value in fields.items()])
+
+    def _set_steps(self, keys, steps):
+        self.keys = tuple(keys)
+        self.steps = tuple(steps)
+        self._outputs = tuple((key, step.output)
+                              for key, step in zip(self.keys, self.steps))
+        self._json_template = '{%s}' % ', '.join(
+            _encode_key(key).replace('%', '%%') + ': %s' for key in self.keys)
+        self._name = profiling.schema_name(self.keys)
+        self._selections = {}
+        self._positional = {}
+
+    def _compile_step(self, key, value):
+        step = self._make_step(key, value)
+        if self.columns is None or isinstance(step, _SchemaStep):
+            return step
+        if isinstance(step, _OutputStep):
+            # fields with their own output read the row by column name
+            step.output = partial(_output_row, step.output, self._column_index)
+        else:
+            step.getter = _column_getter(key, step.field, self._column_index)
+        return step
+
+    def _make_step(self, key, value):
+        if isinstance(value, dict):
+            return _SchemaStep(CompiledSchema(value, self.ordered, self.memoize,
+                                              self.columns))
+        field = _make_field(value)
+        # Only take over the fields whose behaviour we know; subclasses that
+        # override ``output`` keep running their own code.
+        if type(field).output is Raw.output:
+            return _FieldStep(key, field)
+        if type(field).output is Nested.output:
+            return _NestedStep(key, field, self.ordered, self.memoize)
+        if (type(field).output is List.output
+                and type(field).format is List.format
+                and type(field.container).output is Nested.output):
+            return _ListOfNestedStep(key, field, self.ordered, self.memoize)
+        return _OutputStep(key, field)
+
+    def marshal(self, data, envelope=None):
+        """Marshal ``data`` following this plan. Behaves like
+        :func:`~flask_restful.marshal`.
+
+        :param data: the actual object(s) from which the fields are taken from
+        :param envelope: optional key that will be used to envelop the
+            serialized response
+        """
+        if self._is_rows(data):
+            if any(self._is_rows(d) for d in data):
+                items = [self.marshal(d) for d in data]
+            else:
+                items = self._marshal_many(data)
+        elif _is_record_array(data):
+            items = self._marshal_many(data)
+        else:
+            items = self._marshal_one(data)
+        return self.dict_class([(envelope, items)]) if envelope else items
+
+    def dumps(self, data, envelope=None):
+        """Marshal ``data`` following this plan and encode the result to JSON
+        in the same pass, without building the marshalled dicts. Returns the
+        same bytes as ``json.dumps(self.marshal(data, envelope))`` encoded to
+        UTF-8.
+
+        :param data: the actual object(s) from which the fields are taken from
+        :param envelope: optional key that will be used to envelop the
+            serialized response
+        """
+        encoded = self._encode(data)
+        if envelope:
+            encoded = '{%s: %s}' % (_encode_key(envelope), encoded)
+        return encoded.encode('utf-8')
+
+    def select(self, selection):
+        """Return a plan that only outputs the selected fields, as a sparse
+        fieldset requested by a client. Fields that are not selected are
+        never evaluated. Selected fields holding a dict of fields,
+        :class:`Nested` fields and lists of them can carry a sub-selection.
+        Names that are not in the schema are ignored.
+
+        Plans are cached per selection, so selecting the same fields again
+        is cheap.
+
+        :param selection: a fieldset string such as
+            ``'id,name,owner(id,email)'`` (see :func:`parse_fieldset`), or
+            the dict it parses to. ``None`` selects everything.
+        """
+        if selection is None:
+            return self
+        cache_key = (selection if isinstance(selection, six.string_types)
+                     else _freeze_selection(selection))
+        try:
+            return self._selections[cache_key]
+        except KeyError:
+            pass
+
+        if isinstance(selection, six.string_types):
+            selection = parse_fieldset(selection)
+        keys = []
+        steps = []
+        for key, step in zip(self.keys, self.steps):
+            if key not in selection:
+                continue
+            if selection[key] is not None and hasattr(step, 'select'):
+                step = step.select(selection[key])
+            keys.append(key)
+            steps.append(step)
+
+        plan = self.__class__.__new__(self.__class__)
+        plan.ordered = self.ordered
+        plan.memoize = self.memoize
+        plan.dict_class = self.dict_class
+        plan.columns = self.columns
+        plan._column_index = self._column_index
+        plan._selection = _compose_selection(self._selection, selection)
+        plan.fields = OrderedDict((key, self.fields[key]) for key in keys)
+        plan._set_steps(keys, steps)
+        if len(self._selections) >= _SELECTIONS_MAX:
+            # selections come from clients, do not let them fill the memory
+            self._selections.clear()
+        self._selections[cache_key] = plan
+        return plan
+
+    def positional(self, columns):
+        """Return a plan marshalling rows which are plain tuples, such as
+        the rows of a DB-API cursor, rather than dicts or objects. Fields
+        are bound to the position of the column named after their key, or
+        their ``attribute``, once, and read values by index. A dotted
+        attribute reads the rest of its path off the value of the column.
+        Fields with their own ``output``, such as :class:`Url`, are given
+        a read only mapping of the row, by column name.
+
+        Integer and callable attributes are kept as they are. A positional
+        plan takes a tuple for one row and a list for many rows.
+
+        Plans are cached per columns, like selections.
+
+        Ex::
+
+            cursor.execute('SELECT id, title, created FROM todo')
+            plan = fields.compile(todo_fields).positional(cursor.description)
+            marshal(cursor.fetchall(), plan)
+
+        :param columns: the names of the columns, or a cursor's
+            ``description``, whose items start with the column name
+        :raises ValueError: if a field has no column to read
+        """
+        names = _column_names(columns)
+        if names == self.columns:
+            return self
+        try:
+            return self._positional[names]
+        except KeyError:
+            pass
+        plan = self._rebuild(self.ordered, self.memoize, names)
+        if len(self._positional) >= _SELECTIONS_MAX:
+            self._positional.clear()
+        self._positional[names] = plan
+        return plan
+
+    def _rebuild(self, ordered, memoize, columns):
+        # compile the fields again, keeping the selection this plan came from
+        plan = CompiledSchema(self.fields, ordered, memoize, columns)
+        return plan.select(self._selection)
+
+    def marshal_iter(self, data, chunk_size=100):
+        """Lazily marshal the items of any iterable, e.g. a generator or a
+        database cursor, following this plan. Items are pulled and marshalled
+        ``chunk_size`` at a time, so memory use does not grow with the
+        number of items.
+
+        :param data: an iterable of objects to marshal
+        :param int chunk_size: how many items to marshal at once
+        """
+        iterator = iter(data)
+        while True:
+            chunk = list(islice(iterator, chunk_size))
+            if not chunk:
+                return
+            for item in self.marshal(chunk):
+                yield item
+
+    def marshal_parallel(self, data, executor, chunk_size=1000, envelope=None):
+        """Marshal a list following this plan, split in chunks marshalled
+        concurrently on ``executor``. The output keeps the order of ``data``.
+
+        With a thread pool, the workers run in a copy of the current request
+        context, so that fields such as :class:`Url` keep working. Process
+        pools need a picklable plan and data, and fields which do not depend
+        on the request.
+
+        :param data: a list, tuple or NumPy structured array of objects
+        :param executor: a :class:`concurrent.futures.Executor`
+        :param int chunk_size: how many objects each task marshals
+        :param envelope: optional key that will be used to envelop the
+            serialized response
+        """
+        process_pool = (ProcessPoolExecutor is not None
+                        and isinstance(executor, ProcessPoolExecutor))
+        futures = [
+            executor.submit(self.marshal if process_pool
+                            else _in_current_context(self.marshal),
+                            data[start:start + chunk_size])
+            for start in range(0, len(data), chunk_size)]
+        items = [item for future in futures for item in future.result()]
+        return self.dict_class([(envelope, items)]) if envelope else items
+
+    def _is_rows(self, data):
+        # tuples are lists of objects, or one row of a positional plan
+        if self.columns is not None:
+            return isinstance(data, list)
+        return isinstance(data, (list, tuple))
+
+    def _marshal_one(self, obj):
+        if profiling.enabled:
+            return self._marshal_many([obj])[0]
+        return self.dict_class([(key, output(obj)) for key, output in self._outputs])
+
+    def _marshal_many(self, objs):
+        if not self.steps:
+            return [self.dict_class() for _ in objs]
+        if profiling.enabled:
+            columns = self._profiled_columns('output_many', objs)
+        else:
+            columns = [step.output_many(objs) for step in self.steps]
+        keys = self.keys
+        dict_class = self.dict_class
+        return [dict_class(zip(keys, row)) for row in zip(*columns)]
+
+    def _profiled_columns(self, method, objs):
+        columns = []
+        for key, step in zip(self.keys, self.steps):
+            if step.field is None:
+                # nested dicts time their own fields
+                columns.append(getattr(step, method)(objs))
+            else:
+                columns.append(profiling.call(self._name, key, step.field,
+                                              len(objs), getattr(step, method),
+                                              objs))
+        return columns
+
+    def _encode(self, data):
+        if self._is_rows(data):
+            if any(self._is_rows(d) for d in data):
+                return '[%s]' % ', '.join(self._encode(d) for d in data)
+            return '[%s]' % ', '.join(self._encode_many(data))
+        elif _is_record_array(data):
+            return '[%s]' % ', '.join(self._encode_many(data))
+        return self._encode_many([data])[0]
+
+    def _encode_many(self, objs):
+        if not self.steps:
+            return ['{}' for _ in objs]
+        if profiling.enabled:
+            columns = self._profiled_columns('encode_many', objs)
+        else:
+            columns = [step.encode_many(objs) for step in self.steps]
+        template = self._json_template
+        return [template % row for row in zip(*columns)]
+
+
+_SELECTIONS_MAX = 64
+
+
+def parse_fieldset(fieldset):
+    """Parse a sparse fieldset, as sent by a client, into the dict accepted
+    by :meth:`CompiledSchema.select`. Field names are separated by commas and
+    the fields of a nested object are selected between parentheses.
+
+    Example::
+
+        fields.parse_fieldset('id,name,owner(id,email)')
+        => {'id': None, 'name': None, 'owner': {'id': None, 'email': None}}
+
+    :param str fieldset: the fieldset to parse
+    :raises ValueError: if the parentheses are not balanced
+    """
+    selection = {}
+    parents = []
+    name = ''
+    for char in fieldset:
+        if char == ',':
+            _add_selected(selection, name)
+            name = ''
+        elif char == '(':
+            nested = selection.get(name.strip()) or {}
+            selection[name.strip()] = nested
+            parents.append(selection)
+            selection = nested
+            name = ''
+        elif char == ')':
+            if not parents:
+                raise ValueError('Unbalanced parentheses in fieldset: ' + fieldset)
+            _add_selected(selection, name)
+            selection = parents.pop()
+            name = ''
+        else:
+            name += char
+    if parents:
+        raise ValueError('Unbalanced parentheses in fieldset: ' + fieldset)
+    _add_selected(selection, name)
+    return selection
+
+
+def _add_selected(selection, name):
+    name = name.strip()
+    if name:
+        selection.setdefault(name, None)
+
+
+def required_attributes(fields):
+    """Return the attributes that marshalling with ``fields`` reads off the
+    objects, as a set of dotted paths. The fields of :class:`Nested` objects
+    and of lists of them are prefixed with the attribute holding them, so
+    the paths tell which relationships to load and which of their columns.
+
+    Example::
+
+        fields.required_attributes({
+            'id': fields.Integer,
+            'name': fields.String(attribute='title'),
+            'owner': fields.Nested({'email': fields.String}),
+        })
+        => {'id', 'title', 'owner.email'}
+
+    Callable attributes and fields overriding ``output`` cannot be known and
+    are left out, except for :class:`FormattedString` and for :class:`Url`
+    when an application context is available. Fields with a ``loader`` only
+    need the key they read.
+
+    :param fields: a dict of fields or a :class:`CompiledSchema`, e.g. one
+        narrowed down with :meth:`CompiledSchema.select`
+    """
+    attributes = set()
+    _add_required_attributes(attributes, fields, '', frozenset())
+    return attributes
+
+
+def _add_required_attributes(attributes, fields, prefix, seen):
+    if id(fields) in seen:
+        # a schema nesting itself
+        return
+    seen = seen | frozenset([id(fields)])
+    for key, value, compiled in _schema_items(fields):
+        if isinstance(value, (dict, CompiledSchema)):
+            _add_required_attributes(attributes, value, prefix, seen)
+            continue
+        field = _make_field(value)
+        output = type(field).output
+        path = key if field.attribute is None else field.attribute
+        if output is FormattedString.output:
+            attributes.update(prefix + name for name in field._names or ())
+            continue
+        elif output is Url.output:
+            attributes.update(prefix + name for name in _url_arguments(field))
+            continue
+        elif callable(path) or output not in (Raw.output, Nested.output,
+                                              List.output):
+            continue
+        path = prefix + six.text_type(path)
+        nested = None
+        if output is Nested.output and field.loader is None:
+            nested = field.nested
+        elif (output is List.output and field.loader is None
+              and type(field.container).output is Nested.output
+              and field.container.loader is None):
+            nested = field.container.nested
+        if nested is not None:
+            # a narrowed down plan only marshals some of the nested fields
+            nested = compiled if compiled is not None else nested
+            before = len(attributes)
+            _add_required_attributes(attributes, nested, path + '.', seen)
+            if len(attributes) > before:
+                continue
+        attributes.add(path)
+
+
+def _schema_items(fields):
+    """Yield the key and field or nested dict of each field, along with the
+    compiled plan of its nested fields when ``fields`` is compiled"""
+    if not isinstance(fields, CompiledSchema):
+        for key, value in fields.items():
+            yield key, value, None
+        return
+    for key, step in zip(fields.keys, fields.steps):
+        if isinstance(step, _SchemaStep):
+            yield key, step.plan, None
+        elif isinstance(step, _NestedStep):
+            yield key, step.field, step.plan
+        elif isinstance(step, _ListOfNestedStep):
+            yield key, step.field, step.nested.plan
+        else:
+            yield key, step.field, None
+
+
+def _url_arguments(field):
+    if not has_app_context():
+        return ()
+    endpoint = field.endpoint
+    if endpoint is None:
+        if not has_request_context():
+            return ()
+        endpoint = request.endpoint
+    try:
+        rules = current_app.url_map.iter_rules(endpoint)
+    except KeyError:
+        return ()
+    return set(name for rule in rules for name in rule.arguments)
+
+
+def _freeze_selection(selection):
+    return frozenset(
+        (key, None if value is None else _freeze_selection(value))
+        for key, value in selection.items())
+
+
+def _compose_selection(outer, inner):
+    # the selection of a plan selected from an already selected plan
+    if isinstance(inner, six.string_types):
+        inner = parse_fieldset(inner)
+    if inner is None:
+        return outer
+    return dict((key, _compose_selection(outer and outer[key], value))
+                for key, value in inner.items()
+                if outer is None or key in outer)
+
+
+def _is_record_array(data):
+    return (numpy is not None and isinstance(data, numpy.ndarray)
+            and data.ndim == 1 and data.dtype.names is not None)
+
+
+def _field_getter(key, field):
+    return _make_getter(key) if field._getter is None else field._getter
+
+
+def _column_names(columns):
+    # column names or a DB-API cursor.description
+    return tuple(column if isinstance(column, six.string_types) else column[0]
+                 for column in columns)
+
+
+def _column_getter(key, field, column_index):
+    """Return a callable reading the value of ``field`` off a row whose
+    columns are at the positions of ``column_index``"""
+    attribute = key if field.attribute is None else field.attribute
+    if isinstance(attribute, int):
+        return itemgetter(attribute)
+    if callable(attribute):
+        return field._getter
+    name, _, path = attribute.partition('.')
+    if name not in column_index:
+        raise ValueError('No column named %r for the field %r' % (name, key))
+    if not path:
+        return itemgetter(column_index[name])
+    return partial(_get_column_path, column_index[name], tuple(path.split('.')))
+
+
+def _get_column_path(position, keys, row):
+    return _get_value_for_keys(keys, row[position])
+
+
+def _output_row(output, column_index, row):
+    return output(_RowView(row, column_index))
+
+
+class _RowView(Mapping):
+    """A row of a positional plan as a read only mapping of its columns"""
+    __slots__ = ('_row', '_column_index')
+
+    def __init__(self, row, column_index):
+        self._row = row
+        self._column_index = column_index
+
+    def __getitem__(self, key):
+        return self._row[self._column_index[key]]
+
+    def __iter__(self):
+        return iter(self._column_index)
+
+    def __len__(self):
+        return len(self._column_index)
+
+
+class _SchemaStep(object):
+    """A dict of fields nested in another one, read off the same object"""
+    field = None
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.output = plan._marshal_one
+        self.output_many = plan._marshal_many
+        self.encode_many = plan._encode_many
+
+    def select(self, selection):
+        return _SchemaStep(self.plan.select(selection))
+
+
+class _OutputStep(object):
+    """A field with its own ``output``, called for every object"""
+
+    def __init__(self, key, field):
+        self.field = field
+        self.output = partial(field.output, key)
+
+    def output_many(self, objs):
+        output = self.output
+        return [output(obj) for obj in objs]
+
+    def encode_many(self, objs):
+        return _encode_values(self.output_many(objs))
+
+
+class _FieldStep(object):
+    """Compiled counterpart of :meth:`Raw.output`"""
+
+    def __init__(self, key, field):
+        self.field = field
+        self.getter = _field_getter(key, field)
+        self.format = field.format
+        self.format_many = field.format_many
+        self.default = field.default
+        attribute = key if field.attribute is None else field.attribute
+        # the name of the column to read off record arrays, if any
+        self.column = (attribute if isinstance(attribute, six.string_types)
+                       and '.' not in attribute else None)
+
+    def output(self, obj):
+        value = self.getter(obj)
+        if value is None:
+            return self.default
+        return self.format(value)
+
+    def output_many(self, objs):
+        if self.column is not None and _is_record_array(objs):
+            if self.column in objs.dtype.names:
+                return self.format_many(objs[self.column])
+            return [self.output(obj) for obj in objs]
+        getter = self.getter
+        return self.format_many([getter(obj) for obj in objs])
+
+    def encode_many(self, objs):
+        return _encode_values(self.output_many(objs))
+
+
+class _NestedStep(object):
+    """Compiled counterpart of :meth:`Nested.output`"""
+
+    def __init__(self, key, field, ordered=None, memoize=None):
+        self.field = field
+        self.getter = _field_getter(key, field)
+        self.loader = field.loader
+        self.memoize = memoize
+        # reuse the plan if the field nests an already compiled one
+        self.plan = compile(field.nested, ordered, memoize)
+
+    def select(self, selection):
+        step = copy(self)
+        step.plan = self.plan.select(selection)
+        return step
+
+    def output(self, obj):
+        return self.format(self.getter(obj))
+
+    def output_many(self, objs):
+        getter = self.getter
+        return self.format_many([getter(obj) for obj in objs])
+
+    def format(self, value):
+        if self.loader is not None:
+            value = _load(self.loader, [value])[0]
+        return self._format_loaded(value)
+
+    def _format_loaded(self, value):
+        if value is None:
+            if self.field.allow_null:
+                return None
+            elif self.field.default is not None:
+                return self.field.default
+        return self.plan.marshal(value)
+
+    def format_many(self, values):
+        if self.loader is not None:
+            values = _load(self.loader, values)
+        # marshal the single objects together, leave None and lists to format
+        batch = [value for value in values
+                 if value is not None and not isinstance(value, (list, tuple))]
+        if len(batch) == len(values):
+            return self._marshal_many(values)
+        marshalled = iter(self._marshal_many(batch))
+        return [next(marshalled)
+                if value is not None and not isinstance(value, (list, tuple))
+                else self._format_loaded(value)
+                for value in values]
+
+    def encode_many(self, objs):
+        getter = self.getter
+        return self.encode_format_many([getter(obj) for obj in objs])
+
+    def encode_format_many(self, values):
+        if self.loader is not None:
+            values = _load(self.loader, values)
+        batch = [value for value in values
+                 if value is not None and not isinstance(value, (list, tuple))]
+        if len(batch) == len(values):
+            return self._encode_many(values)
+        encoded = iter(self._encode_many(batch))
+        return [next(encoded)
+                if value is not None and not isinstance(value, (list, tuple))
+                else _encode_value(self._format_loaded(value))
+                for value in values]
+
+    def _marshal_many(self, objs):
+        if not self.memoize:
+            return self.plan._marshal_many(objs)
+        distinct, positions = _distinct(objs)
+        marshalled = self.plan._marshal_many(distinct)
+        return [marshalled[position] for position in positions]
+
+    def _encode_many(self, objs):
+        if not self.memoize:
+            return self.plan._encode_many(objs)
+        distinct, positions = _distinct(objs)
+        encoded = self.plan._encode_many(distinct)
+        return [encoded[position] for position in positions]
+
+
+def _in_current_context(func):
+    """Make ``func`` run in a copy of the current request or application
+    context, from another thread"""
+    if has_request_context():
+        return copy_current_request_context(func)
+    if has_app_context():
+        return partial(_call_in_app_context, current_app._get_current_object(),
+                       func)
+    return func
+
+
+def _call_in_app_context(app, func, *args):
+    with app.app_context():
+        return func(*args)
+
+
+def _distinct(objs):
+    """Return the distinct objects, by identity, and the position of each
+    object among them"""
+    seen = {}
+    distinct = []
+    positions = []
+    for obj in objs:
+        position = seen.get(id(obj))
+        if position is None:
+            position = seen[id(obj)] = len(distinct)
+            distinct.append(obj)
+        positions.append(position)
+    return distinct, positions
+
+
+class _ListOfNestedStep(object):
+    """Compiled counterpart of :meth:`List.output` for a list of
+    :class:`Nested`"""
+
+    def __init__(self, key, field, ordered=None, memoize=None):
+        self.field = field
+        self.getter = _field_getter(key, field)
+        self.loader = field.loader
+        self.nested = _NestedStep(key, field.container, ordered, memoize)
+
+    def select(self, selection):
+        step = copy(self)
+        step.nested = self.nested.select(selection)
+        return step
+
+    def output(self, obj):
+        return self.format(self._values([obj])[0])
+
+    def output_many(self, objs):
+        # marshal the elements of all the lists together, then split them
+        values = self._values(objs)
+        elements = []
+        bounds = []
+        for value in values:
+            if _is_list_like(value):
+                start = len(elements)
+                elements.extend(self._elements(value))
+                bounds.append((start, len(elements)))
+            else:
+                bounds.append(None)
+        marshalled = self.nested.format_many(elements)
+        return [marshalled[bound[0]:bound[1]] if bound is not None
+                else self.format(value)
+                for value, bound in zip(values, bounds)]
+
+    def encode_many(self, objs):
+        values = self._values(objs)
+        elements = []
+        bounds = []
+        for value in values:
+            if _is_list_like(value):
+                start = len(elements)
+                elements.extend(self._elements(value))
+                bounds.append((start, len(elements)))
+            else:
+                bounds.append(None)
+        encoded = self.nested.encode_format_many(elements)
+        return ['[%s]' % ', '.join(encoded[bound[0]:bound[1]])
+                if bound is not None
+                else _encode_value(self.format(value))
+                for value, bound in zip(values, bounds)]
+
+    def format(self, value):
+        if _is_list_like(value):
+            return self.nested.format_many(self._elements(value))
+
+        if value is None:
+            return self.field.default
+
+        return [self.nested.plan.marshal(value)]
+
+    def _values(self, objs):
+        getter = self.getter
+        values = [getter(obj) for obj in objs]
+        if self.loader is not None:
+            values = _load(self.loader, values)
+        return values
+
+    @staticmethod
+    def _elements(value):
+        if isinstance(value, set):
+            value = list(value)
+        return [get_value(idx, value) for idx, _ in enumerate(value)]
+
+
+def _load(loader, keys):
+    """Call ``loader`` once for the distinct keys, return what it loaded
+    for each of them"""
+    wanted = list(OrderedDict.fromkeys(key for key in keys if key is not None))
+    loaded = loader(wanted) if wanted else {}
+    return [None if key is None else loaded.get(key) for key in keys]
+
+
+def _uses_loaders(fields, seen=None):
+    """Tell whether a dict of fields has fields with a ``loader``, at any
+    depth"""
+    seen = set() if seen is None else seen
+    if id(fields) in seen:
+        return False
+    seen.add(id(fields))
+    for value in fields.values():
+        if isinstance(value, dict):
+            if _uses_loaders(value, seen):
+                return True
+            continue
+        if isinstance(value, List):
+            if value.loader is not None:
+                return True
+            value = value.container
+        if isinstance(value, Nested):
+            if value.loader is not None:
+                return True
+            nested = value.nested
+            if isinstance(nested, CompiledSchema):
+                nested = nested.fields
+            if isinstance(nested, dict) and _uses_loaders(nested, seen):
+                return True
+    return False
+
+
+def _is_list_like(value):
+    return is_indexable_but_not_string(value) and not isinstance(value, dict)
+
+
+def _encode_key(key):
+    # let json decide how non string keys are written
+    return dumps({key: None})[1:-len(': null}')]
+
+
+def _encode_float(value):
+    # same output as json.dumps
+    if value != value:
+        return 'NaN'
+    elif value == _INFINITY:
+        return 'Infinity'
+    elif value == -_INFINITY:
+        return '-Infinity'
+    return float.__repr__(value)
+
+
+def _encode_bool(value):
+    return 'true' if value else 'false'
+
+
+def _encode_none(value):
+    return 'null'
+
+
+_INFINITY = float('inf')
+
+# the types fields usually output, anything else goes through json.dumps
+_json_encoders = {
+    six.text_type: encode_basestring_ascii,
+    int: int.__repr__,
+    float: _encode_float,
+    bool: _encode_bool,
+    type(None): _encode_none,
+}
+
+
+def _encode_value(value):
+    return _json_encoders.get(type(value), dumps)(value)
+
+
+def _encode_values(values):
+    encoders = _json_encoders
+    return [encoders.get(type(value), dumps)(value) for value in values]
@@ -0,0 +1,99 @@
+"""Optional timing of marshalling, field by field.
+
+Collection is off by default, the marshalling code then only checks
+:data:`enabled`. Once turned on with :func:`enable`, every field output by
+:func:`~flask_restful.marshal` or a compiled schema is timed, and the
+cumulative time, number of values and number of errors are kept per
+schema, field name and field class::
+
+    from flask_restful import profiling
+
+    profiling.enable()
+    marshal(todos, resource_fields)
+    for stat in profiling.get_stats():
+        print(stat['schema'], stat['field'], stat['time'])
+
+Schemas are named after their keys, e.g. ``{id, name, owner}``. The time of
+a :class:`~flask_restful.fields.Nested` field includes the time of the
+fields it nests, which are also reported on their own.
+"""
+from threading import Lock
+from timeit import default_timer
+
+import six
+
+#: Whether marshalling is being timed, see :func:`enable`
+enabled = False
+
+# (schema, field name, field class name) -> [values, errors, seconds]
+_stats = {}
+_lock = Lock()
+
+
+def enable():
+    """Start timing marshalled fields"""
+    global enabled
+    enabled = True
+
+
+def disable():
+    """Stop timing marshalled fields, collected statistics are kept"""
+    global enabled
+    enabled = False
+
+
+def reset():
+    """Forget the collected statistics"""
+    with _lock:
+        _stats.clear()
+
+
+def get_stats():
+    """Return the collected statistics, slowest field first.
+
+    :return: a list of dicts with the ``schema`` name, the ``field`` name, the
+        ``field_class`` name, the number of values output (``calls``), the
+        number of them that raised an exception (``errors``) and the
+        cumulative ``time`` in seconds
+    """
+    with _lock:
+        items = [(key, list(stat)) for key, stat in _stats.items()]
+    stats = [{'schema': schema, 'field': field, 'field_class': field_class,
+              'calls': calls, 'errors': errors, 'time': elapsed}
+             for (schema, field, field_class), (calls, errors, elapsed) in items]
+    return sorted(stats, key=lambda stat: stat['time'], reverse=True)
+
+
+def schema_name(keys):
+    """Name a schema after its keys"""
+    return u'{%s}' % u', '.join(six.text_type(key) for key in keys)
+
+
+def output(schema, key, field, obj):
+    """Time ``field.output(key, obj)``"""
+    return call(schema, key, field, 1, field.output, key, obj)
+
+
+def call(schema, key, field, count, func, *args):
+    """Time ``func(*args)``, which outputs ``count`` values of ``field``"""
+    start = default_timer()
+    try:
+        result = func(*args)
+    except Exception:
+        record(schema, key, field, default_timer() - start, count, count)
+        raise
+    record(schema, key, field, default_timer() - start, count)
+    return result
+
+
+def record(schema, key, field, elapsed, calls=1, errors=0):
+    """Add a measure to the statistics of a field"""
+    stat_key = (schema, six.text_type(key), type(field).__name__)
+    with _lock:
+        stat = _stats.get(stat_key)
+        if stat is None:
+            _stats[stat_key] = [calls, errors, elapsed]
+        else:
+            stat[0] += calls
+            stat[1] += errors
+            stat[2] += elapsed
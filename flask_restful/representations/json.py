@@ -1,11 +1,31 @@
 from __future__ import absolute_import
-from flask import make_response, current_app
-from flask_restful.utils import PY3
+from flask import make_response, current_app, stream_with_context
+from flask_restful.utils import PY3, LazyMarshal, extract_refs
 from json import dumps
+try:
+    from collections.abc import Iterator
+except ImportError:
+    from collections import Iterator
+
+# how many encoded pieces are joined before being handed to the server
+STREAM_CHUNK_SIZE = 100
+
+# media type of the output of output_json_refs
+REFS_MEDIATYPE = 'application/vnd.flask-restful.refs+json'
 
 
 def output_json(data, code, headers=None):
-    """Makes a Flask response with a JSON encoded body"""
+    """Makes a Flask response with a JSON encoded body
+
+    Iterators (e.g. the generators returned by
+    :func:`~flask_restful.marshal_iter`), at the top level or as the value
+    of an envelope, are streamed as a JSON array instead of being built in
+    memory first.
+
+    Data returned by :class:`~flask_restful.marshal_with` with
+    ``encode_json=True`` is encoded straight to bytes unless ``RESTFUL_JSON``
+    or debug mode change the output.
+    """
 
     settings = current_app.config.get('RESTFUL_JSON', {})
 
@@ -16,6 +36,19 @@ def output_json(data, code, headers=None):
         settings.setdefault('indent', 4)
         settings.setdefault('sort_keys', not PY3)
 
+    if isinstance(data, LazyMarshal):
+        if not settings:
+            resp = make_response(data.dumps() + b"\n", code)
+            resp.headers.extend(headers or {})
+            return resp
+        data = data.marshal()
+
+    if _is_stream(data):
+        resp = current_app.response_class(
+            stream_with_context(_iterencode(data, settings)), code)
+        resp.headers.extend(headers or {})
+        return resp
+
     # always end the json dumps with a new line
     # see https://github.com/mitsuhiko/flask/pull/1262
     dumped = dumps(data, **settings) + "\n"
@@ -23,3 +56,102 @@ def output_json(data, code, headers=None):
     resp = make_response(dumped, code)
     resp.headers.extend(headers or {})
     return resp
+
+
+def output_ndjson(data, code, headers=None):
+    """Makes a Flask response with a newline delimited JSON body, one line
+    per item. Lists and iterators are streamed item by item, anything else
+    is written as a single line. The envelope of an iterator is left out,
+    only its items are written. Not registered by default, see
+    :meth:`~flask_restful.Api.representation`."""
+
+    if _is_stream(data) and not isinstance(data, Iterator):
+        # check before the response starts, errors can't be sent afterwards
+        if len(data) != 1:
+            raise ValueError('Only a single iterator, optionally in an '
+                             'envelope, can be written as newline delimited JSON')
+        data = next(iter(data.values()))
+
+    settings = dict(current_app.config.get('RESTFUL_JSON', {}))
+    # every item must fit on its own line
+    settings.pop('indent', None)
+
+    resp = current_app.response_class(
+        stream_with_context(_iterlines(data, settings)), code)
+    resp.headers.extend(headers or {})
+    return resp
+
+
+def output_json_refs(data, code, headers=None):
+    """Makes a Flask response with a JSON encoded body in which the nested
+    objects repeated in the data are written once, in a ``$refs`` table,
+    and replaced by ``{"$ref": n}`` pointers, see
+    :func:`~flask_restful.utils.extract_refs`. Not registered by default,
+    see :meth:`~flask_restful.Api.representation` and
+    :data:`REFS_MEDIATYPE`. Streamed data is written as is."""
+
+    if isinstance(data, LazyMarshal):
+        data = data.marshal()
+    if not _is_stream(data):
+        data = extract_refs(data)
+    return output_json(data, code, headers)
+
+
+def _is_stream(data):
+    if isinstance(data, Iterator):
+        return True
+    return (isinstance(data, dict)
+            and any(isinstance(value, Iterator) for value in data.values()))
+
+
+def _iterencode(data, settings):
+    item_separator, key_separator = settings.get('separators') or (
+        (',', ': ') if settings.get('indent') is not None else (', ', ': '))
+    for chunk in _chunked(_iterencode_value(
+            data, settings, item_separator, key_separator)):
+        yield chunk
+    yield "\n"
+
+
+def _iterencode_value(data, settings, item_separator, key_separator):
+    if isinstance(data, Iterator):
+        yield '['
+        for idx, item in enumerate(data):
+            if idx:
+                yield item_separator
+            yield dumps(item, **settings)
+        yield ']'
+    elif _is_stream(data):
+        yield '{'
+        for idx, (key, value) in enumerate(data.items()):
+            if idx:
+                yield item_separator
+            yield dumps(key) + key_separator
+            for part in _iterencode_value(
+                    value, settings, item_separator, key_separator):
+                yield part
+        yield '}'
+    else:
+        yield dumps(data, **settings)
+
+
+def _iterlines(data, settings):
+    if isinstance(data, (list, tuple, Iterator)):
+        lines = (dumps(item, **settings) + "\n" for item in data)
+    else:
+        lines = iter([dumps(data, **settings) + "\n"])
+    for chunk in _chunked(lines):
+        yield chunk
+
+
+def _chunked(parts):
+    """Join small encoded parts so the server does not write them one by
+    one"""
+    buffered = []
+    for part in parts:
+        buffered.append(part)
+        if len(buffered) >= STREAM_CHUNK_SIZE:
+            yield ''.join(buffered)
+            buffered = []
+    if buffered:
+        yield ''.join(buffered)
@@ -110,9 +110,24 @@ class Argument(object):
                 self.operators, self.store_missing, self.trim, self.nullable)
 
     def source(self, request):
-        """Pulls values off the request in the provided location
+        """Pulls values off the request in the provided location. During
+        :meth:`RequestParser.parse_args`, the values of each location are
+        pulled once and shared by the arguments reading the same location.
+
         :param request: The flask request object to parse arguments from
         """
+        sources = getattr(request, 'argument_sources', None)
+        if not isinstance(sources, dict):
+            return self._source(request)
+        key = (self.location if isinstance(self.location, six.string_types)
+               else tuple(self.location))
+        try:
+            return sources[key]
+        except KeyError:
+            source = sources[key] = self._source(request)
+            return source
+
+    def _source(self, request):
         if isinstance(self.location, six.string_types):
             value = getattr(request, self.location, MultiDict())
             if callable(value):
@@ -320,17 +335,24 @@ class RequestParser(object):
 
         namespace = self.namespace_class()
 
-        # A record of arguments not yet parsed; as each is found
-        # among self.args, it will be popped out
-        req.unparsed_arguments = dict(self.argument_class('').source(req)) if strict else {}
-        errors = {}
-        for arg in self.args:
-            value, found = arg.parse(req, self.bundle_errors)
-            if isinstance(value, ValueError):
-                errors.update(found)
-                found = None
-            if found or arg.store_missing:
-                namespace[arg.dest or arg.name] = value
+        # The values of each location, merged once for all the arguments
+        # reading it, see Argument.source
+        req.argument_sources = {}
+        try:
+            # A record of arguments not yet parsed; as each is found
+            # among self.args, it will be popped out
+            req.unparsed_arguments = dict(self.argument_class('').source(req)) if strict else {}
+            errors = {}
+            for arg in self.args:
+                value, found = arg.parse(req, self.bundle_errors)
+                if isinstance(value, ValueError):
+                    errors.update(found)
+                    found = None
+                if found or arg.store_missing:
+                    namespace[arg.dest or arg.name] = value
+        finally:
+            # the request may change before the next parse
+            req.argument_sources = None
         if errors:
             flask_restful.abort(http_error_code, message=errors)
 
@@ -8,6 +8,8 @@ except ImportError:
 from werkzeug.http import HTTP_STATUS_CODES
 
 PY3 = sys.version_info > (3,)
+# plain dicts keep insertion order as part of the language from 3.7 on
+DICT_ORDERED = sys.version_info >= (3, 7)
 
 
 def http_status_message(code):
@@ -15,6 +17,69 @@ def http_status_message(code):
     return HTTP_STATUS_CODES.get(code, '')
 
 
+class LazyMarshal(object):
+    """Data to be marshalled with a compiled schema once the representation of
+    the response is known. The JSON representation encodes it straight to
+    bytes with :meth:`dumps`, other representations get the marshalled data
+    from :meth:`marshal`."""
+
+    def __init__(self, schema, data, envelope=None):
+        self.schema = schema
+        self.data = data
+        self.envelope = envelope
+
+    def marshal(self):
+        return self.schema.marshal(self.data, self.envelope)
+
+    def dumps(self):
+        return self.schema.dumps(self.data, self.envelope)
+
+
+def extract_refs(data):
+    """Move the dicts that show up more than once in ``data`` to a side
+    table, leaving ``{"$ref": n}`` pointers to their position ``n`` in it
+    everywhere they were. Dicts are told apart by identity, as shared by
+    schemas compiled with ``memoize=True``.
+
+    :return: a dict holding the rewritten ``data`` and the ``$refs`` table
+    """
+    counts = {}
+    _count_dicts(data, counts)
+    refs = []
+    positions = {}
+
+    def replace(value):
+        if isinstance(value, dict):
+            if counts[id(value)] > 1:
+                position = positions.get(id(value))
+                if position is None:
+                    position = positions[id(value)] = len(refs)
+                    refs.append(None)
+                    refs[position] = replace_items(value)
+                return {'$ref': position}
+            return replace_items(value)
+        elif isinstance(value, (list, tuple)):
+            return [replace(item) for item in value]
+        return value
+
+    def replace_items(value):
+        return value.__class__((key, replace(item)) for key, item in value.items())
+
+    return OrderedDict([('data', replace(data)), ('$refs', refs)])
+
+
+def _count_dicts(value, counts):
+    if isinstance(value, dict):
+        seen = counts.get(id(value), 0)
+        counts[id(value)] = seen + 1
+        if not seen:
+            for item in value.values():
+                _count_dicts(item, counts)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _count_dicts(item, counts)
+
+
 def unpack(value):
     """Return a three tuple of data, code, and headers"""
     if not isinstance(value, tuple):
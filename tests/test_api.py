@@ -18,6 +18,12 @@ from flask_restful import OrderedDict
 from json import dumps, loads, JSONEncoder
 from nose.tools import assert_equal  # you need it for tests in form of continuations
 import six
+import sys
+try:
+    import asyncio
+except ImportError:
+    # python 2
+    asyncio = None
 from types import SimpleNamespace
 from unittest.mock import patch
 
@@ -230,6 +236,126 @@ class APITestCase(unittest.TestCase):
 
         self.assertEqual(try_me(), ({'hey': {'foo': 'bar'}}, 200, {'X-test': 123}))
 
+    def test_marshal_decorator_compiled(self):
+        fields = OrderedDict([('foo', flask_restful.fields.Raw)])
+
+        @flask_restful.marshal_with(fields, envelope='hey', compiled=True)
+        def try_me():
+            return [OrderedDict([('foo', 'bar'), ('bat', 'baz')])]
+
+        self.assertEqual(try_me(), {'hey': [{'foo': 'bar'}]})
+
+    def test_marshal_decorator_fieldset(self):
+        fields = OrderedDict([('foo', flask_restful.fields.Raw),
+                              ('bat', flask_restful.fields.Raw)])
+
+        @flask_restful.marshal_with(fields, fieldset_arg='fields')
+        def try_me():
+            return OrderedDict([('foo', 'bar'), ('bat', 'baz')])
+
+        app = Flask(__name__)
+        with app.test_request_context('/?fields=bat'):
+            self.assertEqual(try_me(), {'bat': 'baz'})
+        with app.test_request_context('/'):
+            self.assertEqual(try_me(), {'foo': 'bar', 'bat': 'baz'})
+        with app.test_request_context('/?fields=bat)'):
+            self.assertRaises(BadRequest, try_me)
+
+    @unittest.skipIf(asyncio is None or sys.version_info < (3, 5),
+                     'async_marshal needs python 3.5')
+    def test_marshal_decorator_async(self):
+        fields = OrderedDict([('foo', flask_restful.fields.Raw),
+                              ('bat', flask_restful.fields.Raw)])
+
+        @flask_restful.marshal_with(fields, fieldset_arg='fields', async_=True)
+        def try_me():
+            return [{'foo': asyncio.sleep(0, result='bar'), 'bat': 'baz'}], 201
+
+        app = Flask(__name__)
+        with app.test_request_context('/?fields=foo'):
+            self.assertEqual(try_me(), ([{'foo': 'bar'}], 201, {}))
+
+        @flask_restful.marshal_with(fields, envelope='hey', async_=True)
+        def try_me_later():
+            return asyncio.sleep(0, result={'foo': 'bar', 'bat': asyncio.sleep(0)})
+
+        self.assertEqual(try_me_later(), {'hey': {'foo': 'bar', 'bat': None}})
+
+    def test_marshal_decorator_columns(self):
+        fields = OrderedDict([('foo', flask_restful.fields.Raw),
+                              ('bat', flask_restful.fields.Raw(attribute='baz'))])
+
+        @flask_restful.marshal_with(fields, columns=('foo', 'baz'))
+        def try_me():
+            return [('bar', 1), ('bar', 2)]
+
+        self.assertEqual(try_me(), [{'foo': 'bar', 'bat': 1}, {'foo': 'bar', 'bat': 2}])
+
+    @unittest.skipIf(asyncio is None or sys.version_info < (3, 5),
+                     'async_marshal needs python 3.5')
+    def test_marshal_decorator_columns_async(self):
+        fields = OrderedDict([('foo', flask_restful.fields.Raw),
+                              ('bat', flask_restful.fields.Raw(attribute='baz'))])
+
+        @flask_restful.marshal_with(fields, columns=('foo', 'baz'), async_=True)
+        def try_me():
+            # a tuple is taken for (data, code, headers), return the row with a code
+            return ('bar', asyncio.sleep(0, result=1)), 200
+
+        self.assertEqual(try_me(), ({'foo': 'bar', 'bat': 1}, 200, {}))
+
+        @flask_restful.marshal_with(fields, columns=('foo', 'baz'), async_=True)
+        def try_me_many():
+            return [('bar', 1), ('bar', asyncio.sleep(0, result=2))]
+
+        self.assertEqual(try_me_many(), [{'foo': 'bar', 'bat': 1}, {'foo': 'bar', 'bat': 2}])
+
+    def test_profiling_resource(self):
+        app = Flask(__name__)
+        app.debug = True
+        api = flask_restful.Api(app)
+        fields = OrderedDict([('foo', flask_restful.fields.Raw)])
+
+        class Foo(flask_restful.Resource):
+            @flask_restful.marshal_with(fields)
+            def get(self):
+                return {'foo': 'bar'}
+
+        api.add_resource(Foo, '/foo')
+        api.add_profiling_resource()
+        flask_restful.profiling.reset()
+        try:
+            with app.test_client() as client:
+                client.get('/foo')
+                client.get('/foo')
+                stats = loads(client.get('/_profiling/marshal').data)['fields']
+                self.assertEqual(1, len(stats))
+                self.assertEqual(('{foo}', 'foo', 'Raw', 2, 0),
+                                 tuple(stats[0][k] for k in ('schema', 'field', 'field_class', 'calls', 'errors')))
+                self.assertEqual(204, client.delete('/_profiling/marshal').status_code)
+                self.assertEqual([], loads(client.get('/_profiling/marshal').data)['fields'])
+                app.debug = False
+                self.assertEqual(404, client.get('/_profiling/marshal').status_code)
+        finally:
+            flask_restful.profiling.disable()
+            flask_restful.profiling.reset()
+
+    def test_profiling_resource_outside_debug(self):
+        app = Flask(__name__)
+        api = flask_restful.Api(app)
+        api.add_profiling_resource()
+        flask_restful.profiling.disable()
+        with app.test_client() as client:
+            self.assertEqual(404, client.get('/_profiling/marshal').status_code)
+        self.assertFalse(flask_restful.profiling.enabled)
+
+    def test_marshal_iter(self):
+        fields = OrderedDict([('foo', flask_restful.fields.Integer)])
+        data = ({'foo': i, 'bat': 'baz'} for i in range(5))
+        output = flask_restful.marshal_iter(data, fields, chunk_size=2)
+        self.assertEqual(next(output), {'foo': 0})
+        self.assertEqual(list(output), [{'foo': i} for i in range(1, 5)])
+
     def test_marshal_field_decorator(self):
         field = flask_restful.fields.Raw
 
@@ -957,6 +1083,152 @@ class APITestCase(unittest.TestCase):
         expected = b'{"foo": "bar"}\n'
         self.assertEqual(data, expected)
 
+    def test_json_streamed(self):
+        app = Flask(__name__)
+        api = flask_restful.Api(app)
+
+        class Foo(flask_restful.Resource):
+            @flask_restful.marshal_with({'foo': flask_restful.fields.Integer},
+                                        envelope='data', stream=True)
+            def get(self):
+                return ({'foo': str(i)} for i in range(3))
+
+        api.add_resource(Foo, '/foo')
+
+        with app.test_client() as client:
+            resp = client.get('/foo')
+
+        self.assertTrue(resp.is_streamed)
+        self.assertEqual(resp.headers['Content-Type'], 'application/json')
+        self.assertEqual(resp.data, b'{"data": [{"foo": 0}, {"foo": 1}, {"foo": 2}]}\n')
+
+    def test_json_encoded(self):
+        app = Flask(__name__)
+        api = flask_restful.Api(app)
+        fields = OrderedDict([('foo', flask_restful.fields.Integer),
+                              ('bar', flask_restful.fields.String),
+                              ('baz', flask_restful.fields.Nested(
+                                  {'x': flask_restful.fields.Float},
+                                  allow_null=True))])
+        data = [{'foo': '1', 'bar': u'\xe9"', 'baz': {'x': 1.5}},
+                {'foo': 2, 'bar': None, 'baz': None}]
+
+        class Foo(flask_restful.Resource):
+            @flask_restful.marshal_with(fields, envelope='data',
+                                        encode_json=True)
+            def get(self):
+                return data
+
+        api.add_resource(Foo, '/foo')
+
+        with app.test_client() as client:
+            resp = client.get('/foo')
+            self.assertEqual(resp.headers['Content-Type'], 'application/json')
+            self.assertEqual(resp.data, (dumps(flask_restful.marshal(
+                data, fields, envelope='data')) + "\n").encode('utf-8'))
+
+            api.representations['text/csv'] = lambda data, code, headers: \
+                flask.make_response(repr(data['data'][1]['foo']), code)
+            resp = client.get('/foo', headers={'Accept': 'text/csv'})
+            self.assertEqual(resp.data, b'2')
+
+    def test_json_refs(self):
+        from flask_restful.representations.json import output_json_refs, REFS_MEDIATYPE
+        app = Flask(__name__)
+        api = flask_restful.Api(app)
+        api.representation(REFS_MEDIATYPE)(output_json_refs)
+        owner = {'name': 'bob'}
+        fields = OrderedDict([
+            ('id', flask_restful.fields.Integer),
+            ('owner', flask_restful.fields.Nested({'name': flask_restful.fields.String})),
+        ])
+
+        class Foo(flask_restful.Resource):
+            @flask_restful.marshal_with(fields, envelope='data', memoize=True)
+            def get(self):
+                return [{'id': 1, 'owner': owner}, {'id': 2, 'owner': owner},
+                        {'id': 3, 'owner': {'name': 'alice'}}]
+
+        api.add_resource(Foo, '/foo')
+        expected = [{'id': 1, 'owner': {'name': 'bob'}},
+                    {'id': 2, 'owner': {'name': 'bob'}},
+                    {'id': 3, 'owner': {'name': 'alice'}}]
+
+        with app.test_client() as client:
+            resp = client.get('/foo')
+            self.assertEqual({'data': expected}, loads(resp.data))
+            resp = client.get('/foo', headers={'Accept': REFS_MEDIATYPE})
+            self.assertEqual(resp.headers['Content-Type'], REFS_MEDIATYPE)
+            self.assertEqual({'data': {'data': [{'id': 1, 'owner': {'$ref': 0}},
+                                                {'id': 2, 'owner': {'$ref': 0}},
+                                                {'id': 3, 'owner': {'name': 'alice'}}]},
+                              '$refs': [{'name': 'bob'}]},
+                             loads(resp.data))
+
+        @flask_restful.marshal_with(fields, refs=True)
+        def try_me():
+            return [{'id': 1, 'owner': owner}, {'id': 2, 'owner': owner}]
+        self.assertEqual({'data': [{'id': 1, 'owner': {'$ref': 0}},
+                                   {'id': 2, 'owner': {'$ref': 0}}],
+                          '$refs': [{'name': 'bob'}]}, try_me())
+
+    def test_json_streamed_empty(self):
+        app = Flask(__name__)
+        api = flask_restful.Api(app)
+
+        class Foo(flask_restful.Resource):
+            def get(self):
+                return iter([])
+
+        api.add_resource(Foo, '/foo')
+
+        with app.test_client() as client:
+            self.assertEqual(client.get('/foo').data, b'[]\n')
+
+    def test_ndjson(self):
+        from flask_restful.representations.json import output_ndjson
+        app = Flask(__name__)
+        api = flask_restful.Api(app, default_mediatype='application/x-ndjson')
+        api.representation('application/x-ndjson')(output_ndjson)
+
+        class Foo(flask_restful.Resource):
+            def get(self):
+                return flask_restful.marshal_iter(
+                    ({'foo': i} for i in range(2)), {'foo': flask_restful.fields.Raw})
+
+        api.add_resource(Foo, '/foo')
+
+        with app.test_client() as client:
+            resp = client.get('/foo', headers=[('Accept', 'application/x-ndjson')])
+
+        self.assertEqual(resp.headers['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(resp.data, b'{"foo": 0}\n{"foo": 1}\n')
+
+    def test_ndjson_enveloped(self):
+        from flask_restful.representations.json import output_ndjson
+        app = Flask(__name__)
+        api = flask_restful.Api(app, default_mediatype='application/x-ndjson')
+        api.representation('application/x-ndjson')(output_ndjson)
+
+        class Foo(flask_restful.Resource):
+            @flask_restful.marshal_with({'foo': flask_restful.fields.Raw},
+                                        envelope='data', stream=True)
+            def get(self):
+                return ({'foo': i} for i in range(2))
+
+        class Bar(flask_restful.Resource):
+            def get(self):
+                return {'data': iter([1]), 'more': iter([2])}
+
+        api.add_resource(Foo, '/foo')
+        api.add_resource(Bar, '/bar')
+
+        with app.test_client() as client:
+            resp = client.get('/foo', headers=[('Accept', 'application/x-ndjson')])
+            self.assertEqual(resp.data, b'{"foo": 0}\n{"foo": 1}\n')
+            resp = client.get('/bar', headers=[('Accept', 'application/x-ndjson')])
+            self.assertEqual(resp.status_code, 500)
+
     def test_redirect(self):
         app = Flask(__name__)
         api = flask_restful.Api(app)
@@ -1,17 +1,119 @@
+from collections import namedtuple
 from decimal import Decimal
 from functools import partial
+import copy
 import pytz
+import json
+import pickle
+import sys
 import unittest
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 from mock import Mock
 from flask_restful.fields import MarshallingException
 from flask_restful.utils import OrderedDict
-from flask_restful import fields
+import flask_restful
+from flask_restful import fields, marshal, profiling
 from datetime import datetime, timedelta, tzinfo
 from flask import Flask, Blueprint
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # python 2 without the futures backport
+    ThreadPoolExecutor = None
+try:
+    import dataclasses
+except ImportError:
+    dataclasses = None
+try:
+    import asyncio
+except ImportError:
+    # python 2
+    asyncio = None
 #noinspection PyUnresolvedReferences
 from nose.tools import assert_equals  # you need it for tests in form of continuations
 
 
+class Gate(object):
+    """Hands out awaitables which only complete once all of them are being
+    awaited at the same time"""
+
+    def __init__(self, count):
+        self.count = count
+        self.waiting = []
+
+    def value(self, result):
+        return _GateValue(self, result)
+
+
+class _GateValue(object):
+
+    def __init__(self, gate, result):
+        self.gate = gate
+        self.result = result
+
+    def __await__(self):
+        future = asyncio.get_event_loop().create_future()
+        self.gate.waiting.append((future, self.result))
+        if len(self.gate.waiting) == self.gate.count:
+            for waiting, result in self.gate.waiting:
+                waiting.set_result(result)
+        return future.__await__()
+
+
+class Upper(fields.String):
+    """A field subclass without __slots__"""
+
+    def __init__(self, suffix, **kwargs):
+        super(Upper, self).__init__(**kwargs)
+        self.suffix = suffix
+
+    def format(self, value):
+        return value.upper() + self.suffix
+
+
+class Suffixed(fields.String):
+    """A field subclass with a single name as its __slots__"""
+    __slots__ = 'suffix'
+
+    def __init__(self, suffix, **kwargs):
+        super(Suffixed, self).__init__(**kwargs)
+        self.suffix = suffix
+
+    def format(self, value):
+        return value + self.suffix
+
+
+class Double(fields.Integer):
+
+    def format(self, value):
+        return super(Double, self).format(value) * 2
+
+
+class Up(fields.Float):
+
+    def format(self, value):
+        return super(Up, self).format(value) + 1
+
+
+class Negated(fields.Boolean):
+
+    def format(self, value):
+        return not super(Negated, self).format(value)
+
+
+class Cents(fields.Fixed):
+
+    def format(self, value):
+        return 'X' + super(Cents, self).format(value)
+
+
 class Foo(object):
     def __init__(self):
         self.hey = 3
@@ -150,6 +252,19 @@ class FieldsTestCase(unittest.TestCase):
         field = fields.Raw()
         self.assertEqual(field.output("bar.value", foo), 3)
 
+    def test_dotted_attribute(self):
+        field = fields.String(attribute='a.b.hey')
+        self.assertEqual("3", field.output("foo", {'a': {'b': {'hey': 3}}}))
+        self.assertEqual("3", field.output("foo", {'a': {'b': Foo()}}))
+        self.assertEqual(None, field.output("foo", {'a': {'c': Foo()}}))
+
+    def test_attribute_changed(self):
+        field = fields.String(attribute='bar')
+        field.attribute = 'hey'
+        self.assertEqual("3", field.output("foo", Foo()))
+        field.attribute = None
+        self.assertEqual("3", field.output("hey", Foo()))
+
     def test_formatted_string_invalid_obj(self):
         field = fields.FormattedString("{hey}")
         self.assertRaises(MarshallingException, lambda: field.output("hey", None))
@@ -208,6 +323,42 @@ class FieldsTestCase(unittest.TestCase):
         with app.test_request_context("/", base_url="http://localhost"):
             self.assertEqual("https://localhost/3", field.output("hey", Foo()))
 
+    def test_formatted_string_reads_only_used_values(self):
+        class Todo(object):
+            def __init__(self):
+                self.name = 'bar'
+                self.owner = {'names': ['Doug']}
+
+        field = fields.FormattedString("{name} by {owner[names][0]:>{width}}")
+        self.assertEqual(('name', 'owner', 'width'), tuple(sorted(field._names)))
+        todo = Todo()
+        todo.width = 5
+        self.assertEqual("bar by  Doug", field.output("foo", todo))
+        self.assertRaises(KeyError, lambda: field.output("foo", {'name': 'bar'}))
+
+    def test_formatted_string_does_not_read_other_attributes(self):
+        field = fields.FormattedString("{items} total")
+        self.assertRaises(KeyError, lambda: field.output("foo", {'count': 1}))
+        self.assertRaises(KeyError, lambda: field.output("foo", Foo()))
+        self.assertEqual("1 total", field.output("foo", {'items': 1}))
+
+    def test_url_cached(self):
+        app = Flask(__name__)
+        app.add_url_rule("/todos/<int:id>/<name>", "todo", view_func=lambda x: x)
+        field = fields.Url("todo", absolute=True, scheme='https')
+
+        with app.test_request_context("/", base_url="http://localhost/api"):
+            self.assertEqual("https://localhost/api/todos/1/a%20b",
+                             field.output("uri", {"id": 1, "name": "a b", "x": 2}))
+            self.assertEqual(1, len(field._templates))
+            self.assertEqual("https://localhost/api/todos/2/c",
+                             field.output("uri", {"id": 2, "name": "c"}))
+            self.assertRaises(MarshallingException,
+                              lambda: field.output("uri", None))
+        with app.test_request_context("/", base_url="http://example.com"):
+            self.assertEqual("https://example.com/todos/3/d",
+                             field.output("uri", {"id": 3, "name": "d"}))
+
     def test_url_without_endpoint_invalid_object(self):
         app = Flask(__name__)
         app.add_url_rule("/<hey>", "foobar", view_func=lambda x: x)
@@ -329,6 +480,20 @@ class FieldsTestCase(unittest.TestCase):
         self.assertEqual('3.0000', field4.output("hey", {'hey': '03'}))
         self.assertEqual('3.0000', field4.output("hey", {'hey': '03.0'}))
 
+    def test_fixed_fast_paths(self):
+        field = fields.Fixed(2)
+        # ties are rounded on the exact binary value, as with Decimal
+        self.assertEqual('2.67', field.format(2.675))
+        self.assertEqual('0.12', field.format(0.125))
+        self.assertEqual('-0.00', field.format(-0.001))
+        self.assertEqual('42.00', field.format(42))
+        self.assertEqual('1.00', field.format(True))
+        self.assertEqual('3.14', field.format(self.PI))
+        self.assertEqual(['2.67', None, '3.00', '3.14'],
+                         field.format_many([2.675, None, 3, self.PI]))
+        self.assertRaises(MarshallingException, lambda: field.format(float('nan')))
+        self.assertEqual('0E-7', fields.Fixed(7).format(0.0))
+
     def test_zero_fixed(self):
         field = fields.Fixed()
         self.assertEqual('0.00000', field.output('hey', {'hey': 0}))
@@ -378,6 +543,17 @@ class FieldsTestCase(unittest.TestCase):
         field = fields.DateTime(dt_format='iso8601')
         self.assertEqual("2011-08-22T20:58:45+01:00", field.output("bar", obj))
 
+    def test_date_field_cached(self):
+        aware = datetime(2011, 8, 22, 20, 58, 45, tzinfo=pytz.utc)
+        other = aware.astimezone(pytz.timezone('America/New_York'))
+        field = fields.DateTime(dt_format='iso8601', cache_size=2)
+        self.assertEqual("2011-08-22T20:58:45+00:00", field.format(aware))
+        self.assertEqual("2011-08-22T16:58:45-04:00", field.format(other))
+        self.assertEqual("2011-08-22T20:58:45+00:00", field.format(aware))
+        field.format(datetime(2011, 8, 22))
+        self.assertEqual(2, len(field._formatter.formatted))
+        self.assertRaises(MarshallingException, lambda: field.format("2011"))
+
     def test_unsupported_datetime_format(self):
         obj = {"bar": datetime(2011, 8, 22, 20, 58, 45)}
         field = fields.DateTime(dt_format='raw')
@@ -395,6 +571,58 @@ class FieldsTestCase(unittest.TestCase):
         obj = {"hey": 3}
         self.assertEqual(obj, fields.to_marshallable_type(Bar()))
 
+    def test_to_dict_namedtuple(self):
+        Point = namedtuple('Point', ['x', 'y'])
+        data = fields.to_marshallable_type(Point(1, 2))
+        self.assertEqual(dict, type(data))
+        self.assertEqual({'x': 1, 'y': 2}, data)
+
+    def test_to_dict_slots(self):
+        class Point(object):
+            __slots__ = ('x', 'y')
+
+            def __init__(self, x):
+                self.x = x
+
+        class Point3D(Point):
+            __slots__ = 'z'
+
+        point = Point3D(1)
+        point.z = 3
+        self.assertEqual({'x': 1, 'z': 3}, fields.to_marshallable_type(point))
+        self.assertEqual(3, fields.get_value('z', point))
+
+        class Labelled(Point):
+            pass
+
+        point = Labelled(1)
+        point.label = 'a'
+        self.assertEqual({'x': 1, 'label': 'a'}, fields.to_marshallable_type(point))
+
+    @unittest.skipIf(dataclasses is None, 'dataclasses need python 3.7')
+    def test_to_dict_dataclass(self):
+        Point = dataclasses.make_dataclass('Point', ['x', 'y'])
+        point = Point(1, 2)
+        self.assertEqual({'x': 1, 'y': 2}, fields.to_marshallable_type(point))
+        self.assertEqual('1,2', fields.FormattedString('{x},{y}').output('', point))
+
+    def test_get_value_mapping(self):
+        class Attributes(Mapping):
+            name = 'attribute'
+
+            def __getitem__(self, key):
+                return {'hey': 3}[key]
+
+            def __iter__(self):
+                return iter(['hey'])
+
+            def __len__(self):
+                return 1
+
+        self.assertEqual(3, fields.get_value('hey', Attributes()))
+        self.assertEqual('attribute', fields.get_value('name', Attributes()))
+        self.assertEqual(None, fields.get_value('foo', Attributes()))
+
     def test_get_value(self):
         self.assertEqual(3, fields.get_value("hey", {"hey": 3}))
 
@@ -404,6 +632,27 @@ class FieldsTestCase(unittest.TestCase):
     def test_get_value_obj(self):
         self.assertEqual(3, fields.get_value("hey", Foo()))
 
+    def test_get_value_namedtuple(self):
+        Point = namedtuple('Point', ['x', 'y'])
+        self.assertEqual(2, fields.get_value("y", Point(1, 2)))
+        self.assertEqual(1, fields.get_value(0, Point(1, 2)))
+        self.assertEqual(None, fields.get_value("z", Point(1, 2)))
+
+    def test_get_value_mapping_subclass(self):
+        class Attributes(dict):
+            def __getitem__(self, key):
+                return dict.__getitem__(self, key.lower())
+
+        self.assertEqual(3, fields.get_value("HEY", Attributes(hey=3)))
+        self.assertEqual(None, fields.get_value("foo", Attributes(hey=3)))
+
+    def test_get_value_per_instance_attributes(self):
+        obj = Mock()
+        obj.hey = 3
+        self.assertEqual(3, fields.get_value("hey", obj))
+        self.assertEqual(3, fields.get_value("hey", {'hey': 3}))
+        self.assertEqual(3, fields.get_value(1, [2, 3]))
+
     def test_list(self):
         obj = {'list': ['a', 'b', 'c']}
         field = fields.List(fields.String)
@@ -499,6 +748,411 @@ class FieldsTestCase(unittest.TestCase):
         field = fields.List(fields.Raw)
         self.assertEqual([1, 2, 'a'], field.output('list', obj))
 
+    def test_list_element_kinds(self):
+        # the specialized formatting of the elements gives the same result as
+        # testing every element
+        class Obj(object):
+            def __init__(self, a):
+                self.a = a
+
+        cases = [
+            (fields.List(fields.Integer), [1, None, '3']),
+            (fields.List(fields.String(default='x')), ('a', None, 1)),
+            (fields.List(fields.Raw), [{'a': 1}, None, 2]),
+            (fields.List(fields.Nested({'a': fields.Integer})), [{'a': 1}, None]),
+            (fields.List(fields.Nested({'a': fields.Integer}, allow_null=True)),
+             [{'a': 1}, None]),
+            (fields.List(fields.Nested({'a': fields.Integer}, default={})),
+             [Obj(1), None]),
+            (fields.List(fields.Integer(attribute='a')), [{'a': 1}, Obj(2), 3, None]),
+            (fields.List(fields.String(attribute='a.b')), [{'a': {'b': 1}}]),
+            (fields.List(fields.FormattedString('{a}')), [{'a': 1}, {'a': 2}]),
+        ]
+        for field, value in cases:
+            self.assertEqual(field._format_elements(value), field.format(value))
+
+    def test_list_of_subclass_format(self):
+        # lists of scalars keep the format of container subclasses
+        self.assertEqual({'c': [6]}, marshal({'c': [3]}, {'c': fields.List(Double)}))
+        self.assertEqual({'c': [2.0]}, marshal({'c': [1]}, {'c': fields.List(Up)}))
+        self.assertEqual({'c': ['X1.50']}, marshal({'c': [1.5]}, {'c': fields.List(Cents(2))}))
+
+    def test_compile(self):
+        schema = OrderedDict([
+            ('id', fields.Integer),
+            ('name', fields.String(attribute='hey')),
+            ('meta', OrderedDict([('hey', fields.Raw)])),
+            ('owner', fields.Nested({'hey': fields.Integer}, allow_null=True)),
+            ('tags', fields.List(fields.String)),
+            ('items', fields.List(fields.Nested({'hey': fields.Integer}))),
+        ])
+        objs = [
+            {'id': 1, 'hey': 'a', 'owner': Foo(), 'tags': ['x'], 'items': [Foo(), None]},
+            {'id': '2', 'hey': 'b', 'owner': None, 'tags': None, 'items': {'hey': 4}},
+        ]
+        compiled = fields.compile(schema)
+        self.assertEqual(marshal(objs, schema), compiled.marshal(objs))
+        self.assertEqual(marshal(objs, schema, envelope='data'),
+                         marshal(objs, compiled, envelope='data'))
+        self.assertEqual(marshal(objs[0], schema), marshal(objs[0], compiled))
+
+    def test_compile_list_of_lists(self):
+        compiled = fields.compile({'hey': fields.Integer})
+        self.assertEqual([[{'hey': 1}], {'hey': 2}],
+                         compiled.marshal([[{'hey': '1'}], {'hey': 2}]))
+
+    def test_format_many(self):
+        self.assertEqual([1, 2, 0], fields.Integer().format_many([1, '2', None]))
+        self.assertEqual([1.5, None], fields.Float().format_many([1.5, None]))
+        self.assertEqual([True, False], fields.Boolean().format_many([1, 0]))
+        self.assertEqual(['1', 'x'], fields.String(default='x').format_many([1, None]))
+        self.assertRaises(MarshallingException,
+                          lambda: fields.Integer().format_many([1, 'two']))
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_compile_record_array(self):
+        data = numpy.array([(1, 2.5), (2, 3.5)],
+                           dtype=[('id', 'i4'), ('value', 'f8')])
+        compiled = fields.compile(OrderedDict([
+            ('id', fields.Integer),
+            ('value', fields.Float),
+            ('label', fields.String(default='none')),
+        ]))
+        self.assertEqual([{'id': 1, 'value': 2.5, 'label': 'none'},
+                          {'id': 2, 'value': 3.5, 'label': 'none'}],
+                         compiled.marshal(data))
+        self.assertEqual(int, type(compiled.marshal(data)[0]['id']))
+
+    def test_parse_fieldset(self):
+        self.assertEqual({'id': None, 'name': None,
+                          'owner': {'id': None, 'email': None}},
+                         fields.parse_fieldset('id, name,owner(id,email)'))
+        self.assertEqual({'a': {'b': {'c': None}}, 'd': None},
+                         fields.parse_fieldset('a(b(c)),d'))
+        self.assertRaises(ValueError, lambda: fields.parse_fieldset('a(b'))
+        self.assertRaises(ValueError, lambda: fields.parse_fieldset('a)'))
+
+    def test_compile_select(self):
+        class Exploding(fields.Raw):
+            def output(self, key, obj):
+                raise AssertionError('should not be evaluated')
+
+        compiled = fields.compile(OrderedDict([
+            ('id', fields.Integer),
+            ('uri', Exploding),
+            ('owner', fields.Nested(OrderedDict([
+                ('id', fields.Integer),
+                ('uri', Exploding),
+            ]))),
+            ('items', fields.List(fields.Nested({'id': fields.Integer, 'uri': Exploding}))),
+        ]))
+        obj = {'id': 1, 'owner': {'id': 2}, 'items': [{'id': 3}]}
+        selected = compiled.select('id,owner(id),items(id),unknown')
+        self.assertEqual({'id': 1, 'owner': {'id': 2}, 'items': [{'id': 3}]},
+                         selected.marshal(obj))
+        self.assertEqual([{'owner': {'id': 2}}], compiled.select('owner(id)').marshal([obj]))
+        self.assertTrue(compiled.select('id,owner(id),items(id),unknown') is selected)
+        self.assertTrue(compiled.select(None) is compiled)
+
+    def test_marshal_only(self):
+        schema = {'id': fields.Integer, 'name': fields.String}
+        self.assertEqual({'name': 'a'}, marshal({'id': 1, 'name': 'a'}, schema, only='name'))
+        self.assertEqual(OrderedDict, type(marshal({'id': 1, 'name': 'a'}, schema, only='name')))
+
+    def test_select_survives_recompiling(self):
+        compiled = fields.compile(OrderedDict([
+            ('id', fields.Integer),
+            ('owner', fields.Nested(OrderedDict([
+                ('id', fields.Integer),
+                ('name', fields.String),
+            ]))),
+        ]))
+        selected = compiled.select('owner(id)').select('owner,id')
+        obj = {'id': 1, 'owner': {'id': 2, 'name': 'alice'}}
+        self.assertEqual({'owner': {'id': 2}}, selected.marshal(obj))
+        for plan in [fields.compile(selected, ordered=not selected.ordered),
+                     fields.compile(selected, memoize=True)]:
+            self.assertEqual({'owner': {'id': 2}}, plan.marshal(obj))
+        positional = selected.positional(['id', 'owner'])
+        self.assertEqual({'owner': {'id': 2}},
+                         positional.marshal((1, {'id': 2, 'name': 'alice'})))
+
+    def test_compile_ordered(self):
+        schema = {'hey': fields.Integer, 'sub': {'hey': fields.Integer},
+                  'foo': fields.Nested({'hey': fields.Integer})}
+        data = {'hey': 1, 'foo': {'hey': 2}}
+        for ordered, dict_class in [(True, OrderedDict), (False, dict)]:
+            compiled = fields.compile(schema, ordered=ordered)
+            for output in [compiled.marshal(data, envelope='data')['data'],
+                           compiled.marshal([data])[0]]:
+                self.assertEqual(dict_class, type(output))
+                self.assertEqual(dict_class, type(output['sub']))
+                self.assertEqual(dict_class, type(output['foo']))
+        compiled = fields.compile(schema, ordered=True)
+        self.assertTrue(fields.compile(compiled) is compiled)
+        self.assertFalse(fields.compile(compiled, ordered=False).ordered)
+
+    def test_compile_profiled(self):
+        schema = OrderedDict([('hey', fields.Integer),
+                              ('foo', fields.Nested({'hey': fields.Integer}))])
+        compiled = fields.compile(schema)
+        data = [{'hey': 1, 'foo': {'hey': 2}}, {'hey': 3, 'foo': {'hey': 'x'}}]
+        profiling.reset()
+        profiling.enable()
+        try:
+            self.assertEqual([{'hey': 1, 'foo': {'hey': 2}}],
+                             compiled.marshal(data[:1]))
+            self.assertRaises(MarshallingException,
+                              lambda: compiled.marshal(data[1]))
+        finally:
+            profiling.disable()
+        stats = dict(((stat['schema'], stat['field'], stat['field_class']),
+                      (stat['calls'], stat['errors']))
+                     for stat in profiling.get_stats())
+        profiling.reset()
+        self.assertEqual({('{hey, foo}', 'hey', 'Integer'): (2, 0),
+                          ('{hey, foo}', 'foo', 'Nested'): (2, 1),
+                          ('{hey}', 'hey', 'Integer'): (2, 1)}, stats)
+
+    def test_nested_loader(self):
+        users = {1: {'name': 'bob'}, 2: {'name': 'alice'}}
+        todos = {1: [{'title': 'a'}, {'title': 'b'}], 2: [{'title': 'c'}]}
+        calls = []
+
+        def load(source):
+            def loader(keys):
+                calls.append(keys)
+                return dict((key, source[key]) for key in keys if key in source)
+            return loader
+
+        schema = OrderedDict([
+            ('owner', fields.Nested({'name': fields.String}, allow_null=True,
+                                    attribute='owner_id', loader=load(users))),
+            ('todos', fields.List(fields.Nested({'title': fields.String}),
+                                  attribute='id', loader=load(todos))),
+        ])
+        data = [{'id': 1, 'owner_id': 1}, {'id': 2, 'owner_id': 2},
+                {'id': 3, 'owner_id': 1}, {'id': 4, 'owner_id': None}]
+        expected = [
+            OrderedDict([('owner', {'name': 'bob'}),
+                         ('todos', [{'title': 'a'}, {'title': 'b'}])]),
+            OrderedDict([('owner', {'name': 'alice'}),
+                         ('todos', [{'title': 'c'}])]),
+            OrderedDict([('owner', {'name': 'bob'}), ('todos', None)]),
+            OrderedDict([('owner', None), ('todos', None)]),
+        ]
+        for marshalled in (lambda: marshal(data, schema),
+                           lambda: fields.compile(schema).marshal(data),
+                           lambda: json.loads(fields.compile(schema).dumps(data))):
+            del calls[:]
+            self.assertEqual(expected, marshalled())
+            self.assertEqual([[1, 2], [1, 2, 3, 4]], calls)
+
+        del calls[:]
+        self.assertEqual(expected[0], marshal(data[0], schema))
+        self.assertEqual([[1], [1]], calls)
+
+    def test_required_attributes(self):
+        app = Flask(__name__)
+        app.add_url_rule("/todos/<int:todo_id>", "todo", view_func=lambda x: x)
+        schema = {
+            'id': fields.Integer,
+            'name': fields.String(attribute='title'),
+            'owner': fields.Nested({'email': fields.String,
+                                    'address': {'city': fields.String(attribute='addr.city')}}),
+            'tags': fields.List(fields.String),
+            'comments': fields.List(fields.Nested({'text': fields.Raw})),
+            'label': fields.FormattedString('{title} ({priority})'),
+            'computed': fields.Raw(attribute=lambda obj: 1),
+            'uri': fields.Url('todo'),
+            'project': fields.Nested({'name': fields.String},
+                                     attribute='project_id', loader=dict),
+        }
+        self.assertEqual(set(['id', 'title', 'owner.email', 'owner.addr.city',
+                              'tags', 'comments.text', 'priority', 'project_id']),
+                         fields.required_attributes(schema))
+        with app.app_context():
+            self.assertEqual(
+                set(['id', 'owner.email', 'todo_id']),
+                fields.required_attributes(
+                    fields.compile(schema).select('id,uri,owner(email)')))
+
+    def test_compile_subclass_format(self):
+        # bulk conversions must not skip the format of subclasses
+        schema = {'a': Double, 'b': Up, 'c': Negated}
+        data = [{'a': 1, 'b': 1, 'c': 1}] * 2
+        self.assertEqual([{'a': 2, 'b': 2.0, 'c': False}] * 2,
+                         marshal(data, fields.compile(schema)))
+
+    def test_fixed_subclass_format_many(self):
+        self.assertEqual(['X1.50', None], Cents(2).format_many([1.5, None]))
+
+    def test_compile_memoize(self):
+        formatted = []
+
+        class Name(fields.String):
+            def format(self, value):
+                formatted.append(value)
+                return value
+
+        owner_fields = {'name': Name}
+        schema = {'owner': fields.Nested(owner_fields),
+                  'watchers': fields.List(fields.Nested(owner_fields))}
+        bob, alice = {'name': 'bob'}, {'name': 'alice'}
+        data = [{'owner': bob, 'watchers': [alice, bob]},
+                {'owner': bob, 'watchers': [alice]}]
+        compiled = fields.compile(schema, memoize=True)
+        self.assertTrue(fields.compile(compiled) is compiled)
+        self.assertFalse(fields.compile(compiled, memoize=False).memoize)
+        self.assertEqual(compiled.ordered, fields.compile(compiled, memoize=False).ordered)
+
+        expected = marshal(data, schema)
+        del formatted[:]
+        output = compiled.marshal(data)
+        self.assertEqual(expected, output)
+        self.assertTrue(output[0]['owner'] is output[1]['owner'])
+        self.assertEqual(['bob', 'alice', 'bob'], formatted)
+        self.assertEqual(json.dumps(output).encode('utf-8'), compiled.dumps(data))
+
+    @unittest.skipIf(ThreadPoolExecutor is None, 'concurrent.futures is not available')
+    def test_compile_parallel(self):
+        app = Flask(__name__)
+        app.add_url_rule("/<int:hey>", "foobar", view_func=lambda x: x)
+        schema = {'hey': fields.Integer, 'uri': fields.Url('foobar'),
+                  'foo': fields.Nested({'bar': fields.Fixed(2)})}
+        data = [{'hey': i, 'foo': {'bar': i / 3.0}} for i in range(25)]
+        compiled = fields.compile(schema)
+        with app.test_request_context("/"):
+            expected = compiled.marshal(data)
+            with ThreadPoolExecutor(3) as executor:
+                self.assertEqual(expected, compiled.marshal_parallel(
+                    data, executor, chunk_size=4))
+                output = marshal(data, schema, envelope='data',
+                                 executor=executor, chunk_size=4)
+                self.assertEqual({'data': expected}, output)
+                # like marshal without executor
+                self.assertTrue(isinstance(output['data'][0], OrderedDict))
+            # plans can be sent to process pools
+            self.assertEqual(expected, pickle.loads(pickle.dumps(compiled)).marshal(data))
+
+    @unittest.skipIf(asyncio is None or sys.version_info < (3, 5),
+                     'async_marshal needs python 3.5')
+    def test_async_marshal(self):
+        # every level must be awaited at once, awaiting one value at a time
+        # would time out
+        owners = Gate(3)
+        names = Gate(2)
+        tags = Gate(4)
+        data = [{'id': i, 'owner': owners.value({'name': names.value('user%d' % i)}),
+                 'tags': [{'tag': tags.value('a%d' % i)}, {'tag': tags.value('b%d' % i)}]}
+                for i in range(2)]
+        data.append({'id': 2, 'owner': owners.value(None), 'tags': None})
+        schema = {'id': fields.Integer,
+                  'owner': fields.Nested({'name': fields.String}, allow_null=True),
+                  'tags': fields.List(fields.Nested({'tag': fields.String}))}
+        loop = asyncio.new_event_loop()
+        try:
+            result = loop.run_until_complete(asyncio.wait_for(
+                flask_restful.async_marshal(data, schema, envelope='data'), 1))
+        finally:
+            loop.close()
+        self.assertEqual({'data': [
+            {'id': 0, 'owner': {'name': 'user0'}, 'tags': [{'tag': 'a0'}, {'tag': 'b0'}]},
+            {'id': 1, 'owner': {'name': 'user1'}, 'tags': [{'tag': 'a1'}, {'tag': 'b1'}]},
+            {'id': 2, 'owner': None, 'tags': None},
+        ]}, result)
+
+    def test_slots(self):
+        field = fields.List(fields.Fixed(2, attribute='price'), default=[])
+        self.assertFalse(hasattr(field, '__dict__'))
+        self.assertFalse(hasattr(field.container, '__dict__'))
+        self.assertRaises(AttributeError, setattr, field, 'foo', 1)
+        for copied in (pickle.loads(pickle.dumps(field, protocol))
+                       for protocol in range(pickle.HIGHEST_PROTOCOL + 1)):
+            self.assertEqual(['1.50'], copied.format([{'price': 1.5}]))
+            self.assertEqual([], copied.default)
+
+        # subclasses without __slots__ can keep anything on their instances
+        copied = pickle.loads(pickle.dumps(fields.Nested({'hey': Upper('!', attribute='foo')})))
+        self.assertEqual({'hey': 'BAR!'}, marshal({'foo': 'bar'}, copied.nested))
+
+        # __slots__ may also be a single name
+        field = Suffixed('!', attribute='foo')
+        self.assertFalse(hasattr(field, '__dict__'))
+        for copied in [copy.copy(field), pickle.loads(pickle.dumps(field))]:
+            self.assertEqual('!', copied.suffix)
+            self.assertEqual('foo', copied.attribute)
+            self.assertEqual({'hey': 'bar!'}, marshal({'foo': 'bar'}, {'hey': copied}))
+
+    def test_positional(self):
+        import sqlite3
+        connection = sqlite3.connect(':memory:')
+        connection.execute('CREATE TABLE todo (id INTEGER, title TEXT, owner TEXT)')
+        connection.executemany('INSERT INTO todo VALUES (?, ?, ?)',
+                               [(1, 'a', 'bob'), (2, 'b', 'alice')])
+        schema = OrderedDict([
+            ('id', fields.Integer),
+            ('name', fields.String(attribute='title')),
+            ('label', fields.FormattedString('{id}: {title}')),
+            ('meta', {'owner': fields.String, 'first': fields.Raw(attribute=lambda row: row[0] == 1)}),
+        ])
+        cursor = connection.execute('SELECT * FROM todo')
+        plan = fields.compile(schema, columns=cursor.description)
+        expected = [
+            {'id': 1, 'name': 'a', 'label': '1: a', 'meta': {'owner': 'bob', 'first': True}},
+            {'id': 2, 'name': 'b', 'label': '2: b', 'meta': {'owner': 'alice', 'first': False}},
+        ]
+        self.assertEqual(expected, marshal(cursor.fetchall(), plan))
+        self.assertEqual(expected[0], plan.marshal((1, 'a', 'bob')))
+        self.assertTrue(plan.positional(['id', 'title', 'owner']) is plan)
+
+        cursor = connection.execute('SELECT * FROM todo')
+        self.assertEqual(expected, list(flask_restful.marshal_iter(
+            cursor, schema, chunk_size=1, columns=cursor.description)))
+        self.assertEqual([{'id': 2, 'name': 'b'}], marshal(
+            [(2, 'b', 'alice')], schema, only='id,name', columns=('id', 'title', 'owner')))
+        # dicts of fields marshal to OrderedDicts, like marshal without columns
+        self.assertTrue(isinstance(marshal(
+            (2, 'b', 'alice'), schema, columns=('id', 'title', 'owner')), OrderedDict))
+        self.assertRaises(ValueError, fields.compile(schema).positional, ['id', 'title'])
+
+    @unittest.skipIf(ThreadPoolExecutor is None, 'concurrent.futures is not available')
+    def test_positional_parallel(self):
+        schema = OrderedDict([('a', fields.Integer), ('b', fields.String)])
+        plan = fields.compile(schema, columns=['a', 'b'])
+        with ThreadPoolExecutor(2) as executor:
+            # a tuple is one row, not a list of rows
+            self.assertEqual({'a': 1, 'b': 'x'}, marshal(
+                (1, 'x'), plan, executor=executor, chunk_size=1))
+            output = marshal([(1, 'x'), (2, 'y')], schema, executor=executor,
+                             chunk_size=1, columns=['a', 'b'])
+            self.assertEqual([{'a': 1, 'b': 'x'}, {'a': 2, 'b': 'y'}], output)
+            self.assertTrue(isinstance(output[0], OrderedDict))
+
+    def test_compile_nested_compiled(self):
+        nested = fields.compile({'a': fields.Raw})
+        compiled = fields.compile({'owner': fields.Nested(nested),
+                                   'items': fields.List(fields.Nested(nested))})
+        self.assertTrue(compiled.steps[0].plan is nested)
+        self.assertEqual({'owner': {'a': 1}, 'items': [{'a': 2}]},
+                         compiled.marshal({'owner': {'a': 1}, 'items': [{'a': 2}]}))
+
+        loaded = fields.compile({'a': fields.Nested({'b': fields.Raw},
+                                                    loader=lambda keys: {})})
+        self.assertTrue(fields._uses_loaders({'owner': fields.Nested(loaded)}))
+
+    def test_compile_compiled(self):
+        compiled = fields.compile({'hey': fields.Raw})
+        self.assertTrue(fields.compile(compiled) is compiled)
+
+    def test_compile_keeps_custom_output(self):
+        class Constant(fields.Nested):
+            def output(self, key, obj):
+                return 'constant'
+
+        compiled = fields.compile({'hey': Constant({'foo': fields.Raw})})
+        self.assertEqual({'hey': 'constant'}, compiled.marshal(Foo()))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -195,6 +195,29 @@ class ReqParseTestCase(unittest.TestCase):
         arg = Argument('foo')
         self.assertEqual(arg.source(req), req.values)
 
+    def test_sources_read_once_per_parse(self):
+        class CountingRequest(object):
+            reads = 0
+            json = None
+
+            @property
+            def values(self):
+                self.reads += 1
+                return MultiDict([('foo', '1'), ('bar', '2')])
+
+        req = CountingRequest()
+        parser = RequestParser()
+        parser.add_argument('foo', type=int)
+        parser.add_argument('bar', type=int)
+        parser.add_argument('baz', location=['json', 'values'])
+        args = parser.parse_args(req, strict=True)
+        self.assertEqual({'foo': 1, 'bar': 2, 'baz': None}, args)
+        self.assertEqual(1, req.reads)
+        self.assertEqual(None, req.argument_sources)
+
+        parser.parse_args(req)
+        self.assertEqual(2, req.reads)
+
     def test_option_case_sensitive(self):
         arg = Argument("foo", choices=["bar", "baz"], case_sensitive=True)
         self.assertEqual(True, arg.case_sensitive)